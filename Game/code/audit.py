@@ -0,0 +1,130 @@
+import json
+import tracemalloc
+from collections import Counter
+from settings import *
+from soil import SoilTile, WaterTile, Plant
+from sprites import Tree
+
+# the logical group every drawn sprite of these classes must also belong to
+OWNERS = {
+	SoilTile: ('soil_sprites', lambda level: level.soil_layer.soil_sprites),
+	WaterTile: ('water_sprites', lambda level: level.soil_layer.water_sprites),
+	Plant: ('plant_sprites', lambda level: level.soil_layer.plant_sprites),
+	Tree: ('tree_sprites', lambda level: level.tree_sprites)}
+
+class Auditor:
+	def __init__(self, enabled = AUDIT, export_path = AUDIT_EXPORT, interval = AUDIT_INTERVAL):
+		self.enabled = False
+		self.export_path = export_path
+		self.interval = interval
+		self.frame_index = 0
+		self.day = 0
+
+		# census at every new day, and the orphans that were already reported
+		self.days = []
+		self.reported = set()
+		self.snapshot = None
+
+		if enabled or export_path is not None:
+			self.start()
+
+	def start(self):
+		self.enabled = True
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	def census(self, level):
+		classes = Counter(type(sprite).__name__ for sprite in level.all_sprites)
+		return {'classes': dict(classes), **level.sprite_counts()}
+
+	def orphans(self, level):
+		found = []
+
+		# drawn, but dropped by the group that owns it
+		apples = set()
+		for tree in level.tree_sprites:
+			apples.update(tree.apple_sprites)
+		for sprite in level.all_sprites:
+			owner = OWNERS.get(type(sprite))
+			if owner and sprite not in owner[1](level):
+				found.append((sprite, f'in all_sprites but not in {owner[0]}'))
+			elif sprite.z == LAYERS['fruit'] and sprite not in apples:
+				found.append((sprite, 'apple in all_sprites but on no tree'))
+
+		# still colliding, but no longer drawn
+		for sprite in level.collision_sprites:
+			if sprite not in level.all_sprites and type(sprite) in OWNERS:
+				found.append((sprite, 'in collision_sprites but not in all_sprites'))
+
+		# killed, but still held by a per cell index
+		for index_name in ('soil_tiles', 'water_tiles', 'plant_tiles'):
+			for cell, sprite in getattr(level.soil_layer, index_name).items():
+				if not sprite.alive():
+					found.append((sprite, f'killed but still in {index_name} at {cell}'))
+
+		return found
+
+	def check(self, level):
+		orphans = self.orphans(level)
+		for sprite, reason in orphans:
+			if (id(sprite), reason) not in self.reported:
+				self.reported.add((id(sprite), reason))
+				print(f'audit: {type(sprite).__name__} at {sprite.rect.topleft} {reason}')
+		return orphans
+
+	def end_frame(self, level):
+		if not self.enabled:
+			return
+		self.frame_index += 1
+		if self.frame_index % self.interval == 0:
+			self.check(level)
+
+	def growth(self):
+		# per class change against the previous day and against the first one
+		if len(self.days) < 2:
+			return {}
+		first, previous, current = self.days[0]['classes'], self.days[-2]['classes'], self.days[-1]['classes']
+		changes = {}
+		for name in first.keys() | previous.keys() | current.keys():
+			count = current.get(name, 0)
+			if count != previous.get(name, 0) or count != first.get(name, 0):
+				changes[name] = {'day': count - previous.get(name, 0), 'total': count - first.get(name, 0)}
+		return changes
+
+	def memory_growth(self):
+		snapshot = tracemalloc.take_snapshot().filter_traces((
+			tracemalloc.Filter(False, tracemalloc.__file__),
+			tracemalloc.Filter(False, '<frozen importlib._bootstrap>')))
+		previous, self.snapshot = self.snapshot, snapshot
+		if previous is None:
+			return []
+
+		stats = snapshot.compare_to(previous, 'lineno')[:AUDIT_TOP]
+		return [{'where': str(stat.traceback), 'size_kb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff} for stat in stats if stat.size_diff > 0]
+
+	def on_reset(self, level):
+		if not self.enabled:
+			return
+
+		self.day += 1
+		self.days.append(self.census(level))
+		orphans = self.check(level)
+		record = {
+			'day': self.day,
+			'frame': self.frame_index,
+			**self.days[-1],
+			'growth': self.growth(),
+			'orphans': len(orphans),
+			'memory': self.memory_growth(),
+			'traced_kb': round(tracemalloc.get_traced_memory()[0] / 1024, 1)}
+
+		growing = ', '.join(f'{name} {change["day"]:+d}' for name, change in record['growth'].items() if change['day'])
+		print(f'audit: day {self.day}, {record["groups"]["all"]} sprites, {len(orphans)} orphans, '
+			f'{record["traced_kb"]} KB traced' + (f', growing: {growing}' if growing else ''))
+
+		if self.export_path:
+			with open(self.export_path, 'a') as file:
+				file.write(json.dumps(record, ensure_ascii = False) + '\n')
+
+# shared by every level, so the trend carries across restarts
+auditor = Auditor()
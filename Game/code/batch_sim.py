@@ -0,0 +1,193 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pygame
+from settings import *
+from soil import FARMABLE, TILLED, PLANTED
+from level import Level
+
+# every session scales these defaults, so a worker can run many configs in a row
+BASE_GROW_SPEED = dict(GROW_SPEED)
+BASE_SALE_PRICES = dict(SALE_PRICES)
+BASE_PURCHASE_PRICES = dict(PURCHASE_PRICES)
+
+# the scripted player runs from the kid once it gets this close
+EVADE_DISTANCE = 160
+HEADINGS = [
+    (pygame.K_UP,), (pygame.K_DOWN,), (pygame.K_LEFT,), (pygame.K_RIGHT,),
+    (pygame.K_UP, pygame.K_LEFT), (pygame.K_UP, pygame.K_RIGHT),
+    (pygame.K_DOWN, pygame.K_LEFT), (pygame.K_DOWN, pygame.K_RIGHT)]
+
+def apply_config(config):
+    # the game reads these dicts at use time, so updating them in place is enough
+    GROW_SPEED.update({crop: speed * config['grow_scale'] for crop, speed in BASE_GROW_SPEED.items()})
+    SALE_PRICES.update({item: round(price * config['sale_scale']) for item, price in BASE_SALE_PRICES.items()})
+    PURCHASE_PRICES.update({seed: round(price * config['purchase_scale']) for seed, price in BASE_PURCHASE_PRICES.items()})
+
+class Session:
+    def __init__(self, config, seed, day_length, plot_size):
+        random.seed(seed)
+        apply_config(config)
+
+        self.level = Level(headless=True)
+        self.level.player_enemy.speed = config['enemy_speed']
+        self.player = self.level.player
+        self.keys = self.player.key_source
+        self.day_length = day_length
+        self.plot = self.choose_plot(plot_size)
+        self.heading = None
+        self.last_pos = self.player.pos.copy()
+
+    def choose_plot(self, plot_size):
+        # the farmable cells closest to where the player wakes up
+        soil = self.level.soil_layer
+        start = np.array(self.player.rect.center) // TILE_SIZE
+        cells = np.argwhere(soil.grid & FARMABLE)[:, ::-1]
+        nearest = cells[np.argsort(np.abs(cells - start).sum(axis=1), kind='stable')[:plot_size]]
+        return [(int(x) * TILE_SIZE + TILE_SIZE // 2, int(y) * TILE_SIZE + TILE_SIZE // 2) for x, y in nearest]
+
+    def finished(self):
+        return self.player.money > WIN_MONEY or self.player.money < BANKRUPT_MONEY
+
+    def trade(self):
+        menu = self.level.menu
+        for item in self.player.item_inventory:
+            while menu.sell(item):
+                pass
+
+        # one seed per plot cell, fastest growing crop first
+        for seed in sorted(GROW_SPEED, key=GROW_SPEED.get, reverse=True):
+            while sum(self.player.seed_inventory.values()) < len(self.plot) and menu.buy(seed):
+                pass
+
+    def farm(self):
+        # works the plot through the soil layer, the same calls the tools make
+        soil = self.level.soil_layer
+        for cell in soil.find_harvestable():
+            self.level.harvest(soil.plant_tiles[cell])
+
+        for pos in self.plot:
+            soil.get_hit(pos)
+            soil.water(pos)
+
+            x, y = soil.get_cell(pos)
+            seeds = [seed for seed, amount in self.player.seed_inventory.items() if amount > 0]
+            if seeds and soil.grid[y, x] & TILLED and not soil.grid[y, x] & PLANTED:
+                soil.plant_seed(pos, seeds[0])
+                self.player.seed_inventory[seeds[0]] -= 1
+
+    def evade(self):
+        away = self.player.pos - self.level.player_enemy.pos
+        if away.length() >= EVADE_DISTANCE:
+            self.keys.release()
+            self.heading = None
+            return
+
+        # run straight away from the kid, and pick a random way out when a wall stops us
+        if self.heading is None:
+            self.heading = (
+                pygame.K_RIGHT if away.x > 0 else pygame.K_LEFT,
+                pygame.K_DOWN if away.y > 0 else pygame.K_UP)
+        elif self.player.pos == self.last_pos:
+            self.heading = random.choice(HEADINGS)
+        self.last_pos = self.player.pos.copy()
+
+        self.keys.release()
+        self.keys.press(*self.heading)
+
+    def play_day(self):
+        self.farm()
+        self.trade()
+        for _ in range(round(self.day_length / FIXED_DT)):
+            self.evade()
+            self.level.update(FIXED_DT)
+            if self.finished():
+                return
+
+        # the night goes on until the transition has woken the player again
+        self.keys.release()
+        self.player.sleep = True
+        while self.player.sleep and not self.finished():
+            self.level.update(FIXED_DT)
+
+    def play(self, days):
+        for day in range(1, days + 1):
+            self.play_day()
+            if self.finished():
+                break
+        return {
+            'won': self.player.money > WIN_MONEY,
+            'bankrupt': self.player.money < BANKRUPT_MONEY,
+            'days': day,
+            'money': self.player.money}
+
+def run_session(job):
+    config_index, config, seed, days, day_length, plot_size = job
+    return config_index, Session(config, seed, day_length, plot_size).play(days)
+
+def summarise(config, results):
+    days_to_win = [result['days'] for result in results if result['won']]
+    return {
+        **config,
+        'sessions': len(results),
+        'win_rate': round(len(days_to_win) / len(results), 4),
+        'bankrupt_rate': round(sum(result['bankrupt'] for result in results) / len(results), 4),
+        'mean_days_to_win': round(statistics.mean(days_to_win), 2) if days_to_win else '',
+        'median_days_to_win': statistics.median(days_to_win) if days_to_win else '',
+        'mean_money': round(statistics.mean(result['money'] for result in results), 1)}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Play scripted headless sessions over a grid of balance settings.')
+    parser.add_argument('--sessions', type=int, default=20, help='sessions per config')
+    parser.add_argument('--days', type=int, default=30, help='days before a session gives up')
+    parser.add_argument('--day-length', type=float, default=60, help='seconds of play before going to bed')
+    parser.add_argument('--plot', type=int, default=12, help='cells the scripted player farms')
+    parser.add_argument('--grow-scale', type=float, nargs='+', default=[1])
+    parser.add_argument('--sale-scale', type=float, nargs='+', default=[1])
+    parser.add_argument('--purchase-scale', type=float, nargs='+', default=[1])
+    parser.add_argument('--enemy-speed', type=float, nargs='+', default=[ENEMY_SPEED])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='batch_results.csv')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output)
+
+    # assets are loaded relative to the code folder, workers inherit the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    configs = [
+        {'grow_scale': grow, 'sale_scale': sale, 'purchase_scale': purchase, 'enemy_speed': enemy}
+        for grow, sale, purchase, enemy in itertools.product(args.grow_scale, args.sale_scale, args.purchase_scale, args.enemy_speed)]
+    jobs = [
+        (config_index, config, args.seed + session, args.days, args.day_length, args.plot)
+        for config_index, config in enumerate(configs)
+        for session in range(args.sessions)]
+
+    start_time = time.perf_counter()
+    results = [[] for _ in configs]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for config_index, result in executor.map(run_session, jobs, chunksize=max(1, len(jobs) // (args.workers * 4))):
+            results[config_index].append(result)
+
+    rows = [summarise(config, config_results) for config, config_results in zip(configs, results)]
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f'{len(jobs)} sessions in {time.perf_counter() - start_time:.1f}s, results in {output}')
+    for row in rows:
+        print(row)
+
+if __name__ == '__main__':
+    main()
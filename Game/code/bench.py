@@ -0,0 +1,243 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pygame
+from settings import *
+from soil import FARMABLE
+from level import Level
+
+# peak memory comes from the resource module, which Windows does not have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def teleport(level, pos):
+    player = level.player
+    player.pos = pygame.math.Vector2(pos)
+    player.hitbox.center = (round(player.pos.x), round(player.pos.y))
+    player.rect.center = player.hitbox.center
+
+def cell_center(x, y):
+    return (x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2)
+
+def farmable_cells(level):
+    return [(int(x), int(y)) for y, x in np.argwhere(level.soil_layer.grid & FARMABLE)]
+
+def plant_cells(level, cells):
+    soil = level.soil_layer
+    player = level.player
+    for index, (x, y) in enumerate(cells):
+        pos = cell_center(x, y)
+        soil.get_hit(pos)
+        soil.water(pos)
+        soil.plant_seed(pos, player.seeds[index % len(player.seeds)])
+
+# every scenario is a script that yields the events of one frame at a time
+
+def idle(level):
+    for _ in range(600):
+        yield []
+
+def till_and_plant(level):
+    # the whole Farmable layer, a cell per frame, with the camera over the field
+    cells = farmable_cells(level)
+    teleport(level, np.mean([cell_center(x, y) for x, y in cells], axis=0).tolist())
+    for cell in cells:
+        plant_cells(level, [cell])
+        yield []
+
+    for _ in range(300):
+        yield []
+
+def rainy_day(level):
+    level.raining = True
+    level.soil_layer.raining = True
+    plant_cells(level, farmable_cells(level)[:40])
+
+    # walk back and forth so the camera, the rain and the collisions all move
+    keys = level.player.key_source
+    for frame in range(600):
+        keys.release()
+        keys.press(pygame.K_RIGHT if frame // 150 % 2 == 0 else pygame.K_LEFT)
+        yield []
+    keys.release()
+
+def chop_trees(level):
+    for tree in level.tree_sprites.sprites():
+        teleport(level, tree.rect.midbottom)
+        while tree.health > 0:
+            tree.damage()
+            yield []
+        yield []
+
+    for _ in range(60):
+        yield []
+
+def shop_chat(level):
+    level.toggle_shop_ui()
+    menu = level.menu
+    menu.chat_active = True
+    for index in range(200):
+        menu.chat_messages.append(('玩家' if index % 2 == 0 else '商人', f'message {index} ' * 4))
+
+    # type into the chat box without ever sending, so no request leaves the process
+    for frame in range(600):
+        if frame % 10 == 0:
+            yield [pygame.event.Event(pygame.KEYDOWN, key = pygame.K_a, unicode = 'a', mod = 0, scancode = 0)]
+        else:
+            yield []
+
+def sleep_cycles(level):
+    plant_cells(level, farmable_cells(level)[:40])
+
+    # the transition is jumped to its dark and bright ends, so each night costs two frames
+    for _ in range(30):
+        level.player.sleep = True
+        level.transition.color = 0
+        yield []
+        level.transition.color = 255
+        yield []
+        for _ in range(10):
+            yield []
+
+SCENARIOS = {
+    'idle': idle,
+    'till_and_plant': till_and_plant,
+    'rainy_day': rainy_day,
+    'chop_trees': chop_trees,
+    'shop_chat': shop_chat,
+    'sleep_cycles': sleep_cycles,
+}
+
+def distribution(samples):
+    samples = sorted(samples)
+    pick = lambda fraction: samples[min(int(fraction * len(samples)), len(samples) - 1)]
+    return {
+        'mean': round(statistics.mean(samples), 3),
+        'p50': round(pick(0.5), 3),
+        'p95': round(pick(0.95), 3),
+        'p99': round(pick(0.99), 3),
+        'max': round(samples[-1], 3)}
+
+def run_scenario(name, seed, warmup):
+    # an offscreen display, so drawing is measured without opening a window
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    random.seed(seed)
+    np.random.seed(seed)
+    level = Level(headless=True)
+
+    frame_times = []
+    script = SCENARIOS[name](level)
+    while True:
+        start_time = time.perf_counter()
+        events = next(script, None)
+        if events is None:
+            break
+        level.run(FIXED_DT, events)
+        frame_times.append((time.perf_counter() - start_time) * 1000)
+
+    measured = frame_times[warmup:] or frame_times
+    return {
+        'frames': len(measured),
+        'frame_ms': distribution(measured),
+        'total_s': round(sum(measured) / 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        **level.sprite_counts()}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            print(f'{name:<16} no baseline')
+            continue
+
+        changes = []
+        for metric in ('p50', 'p95', 'p99'):
+            old, new = before['frame_ms'][metric], result['frame_ms'][metric]
+            change = new / old - 1 if old else 0
+            changes.append(f'{metric} {old:.2f} -> {new:.2f} ({change:+.0%})')
+            if change > tolerance:
+                regressions.append(f'{name} {metric}')
+        print(f'{name:<16} ' + '  '.join(changes))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run scripted headless scenarios and report frame times.')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help='any of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=10, help='frames left out of the distribution')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='slowdown allowed before a regression is reported')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error('unknown scenario: ' + ', '.join(unknown))
+    return args
+
+def main():
+    args = parse_args()
+    baseline_path = os.path.abspath(args.baseline)
+    output = args.output and os.path.abspath(args.output)
+
+    # assets are loaded relative to the code folder, workers inherit the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # each scenario gets a freshly spawned process, so caches and peak memory start from scratch
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in args.scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(run_scenario, name, args.seed, args.warmup).result()
+        frame_ms = results[name]['frame_ms']
+        print(f'{name:<16} {results[name]["frames"]:>5} frames  p50 {frame_ms["p50"]:6.2f}  p95 {frame_ms["p95"]:6.2f}  '
+              f'p99 {frame_ms["p99"]:6.2f}  max {frame_ms["max"]:7.2f} ms  rss {results[name]["peak_rss_mb"]} MB  '
+              f'sprites {results[name]["groups"]["all"]}')
+
+    report = {
+        'meta': {'seed': args.seed, 'python': platform.python_version(), 'pygame': pygame.version.ver, 'machine': platform.machine()},
+        'scenarios': results}
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=1)
+
+    regressions = []
+    if args.save_baseline:
+        with open(baseline_path, 'w') as file:
+            json.dump(report, file, indent=1)
+        print(f'baseline saved to {baseline_path}')
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+    if regressions:
+        print('slower than the baseline: ' + ', '.join(regressions))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
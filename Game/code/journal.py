@@ -0,0 +1,182 @@
+import os
+import struct
+import zlib
+from settings import *
+from snapshot import ITEMS, SEEDS, CROPS, place, autosaver
+
+JOURNAL_VERSION = 1
+MAGIC = b'HMJL'
+
+# magic, version, generation of the snapshot the records apply to
+HEADER = struct.Struct('<4sHI')
+
+# kind, flag, x, y, value and a crc32 of those, so a torn last record is never replayed
+PAYLOAD = struct.Struct('<BBhhi')
+CRC = struct.Struct('<I')
+RECORD_SIZE = PAYLOAD.size + CRC.size
+
+# world changes, replayed in order on top of the snapshot
+TILL = 1       # cell x y, flag set when the rain watered the farm
+WATER = 2      # cell x y
+PLANT = 3      # cell x y, flag is the crop index
+HARVEST = 4    # cell x y
+DAMAGE = 5     # value is the tree index, x y the offset of the apple taken when flag is set
+
+# player state, written as new values whenever they differ from the last record
+MONEY = 6      # value
+ITEM = 7       # flag is the item index, value the amount
+SEED = 8       # flag is the seed index, value the amount
+POSITION = 9   # x y
+
+class Journal:
+	def __init__(self, save_path):
+		self.save_path = save_path
+		self.generation = 0
+		self.active = False
+		self.buffer = bytearray()
+		self.count = 0
+
+		# only ever touched on the autosave thread
+		self.file = None
+
+		# last written money, inventory and position records
+		self.values = {}
+
+	def path(self, generation):
+		# two files taking turns, so the previous journal survives until the snapshot that replaces it is on disk
+		return f'{self.save_path}.journal{generation % 2}'
+
+	def record(self, kind, x = 0, y = 0, flag = 0, value = 0):
+		if not self.active:
+			return
+		payload = PAYLOAD.pack(kind, flag, x, y, value)
+		self.buffer += payload
+		self.buffer += CRC.pack(zlib.crc32(payload))
+		self.count += 1
+
+	def till(self, x, y, raining):
+		self.record(TILL, x, y, raining)
+
+	def water(self, x, y):
+		self.record(WATER, x, y)
+
+	def plant(self, x, y, plant_type):
+		self.record(PLANT, x, y, CROPS.index(plant_type))
+
+	def harvest(self, x, y):
+		self.record(HARVEST, x, y)
+
+	def damage(self, index, apple_offset):
+		if apple_offset is None:
+			self.record(DAMAGE, value = index)
+		else:
+			self.record(DAMAGE, *apple_offset, flag = 1, value = index)
+
+	def track(self, kind, flag = 0, value = 0, x = 0, y = 0):
+		if self.values.get((kind, flag)) != (x, y, value):
+			self.values[(kind, flag)] = (x, y, value)
+			self.record(kind, x, y, flag, value)
+
+	def track_player(self, player):
+		self.track(MONEY, value = player.money)
+		for index, item in enumerate(ITEMS):
+			self.track(ITEM, index, player.item_inventory[item])
+		for index, seed in enumerate(SEEDS):
+			self.track(SEED, index, player.seed_inventory[seed])
+		self.track(POSITION, x = round(player.pos.x), y = round(player.pos.y))
+
+	def flush(self):
+		# handed to the autosave thread, behind any snapshot that was asked for first
+		if self.buffer and self.active:
+			autosaver.submit(self.append, bytes(self.buffer))
+		self.buffer.clear()
+
+	def rotate(self, generation):
+		# starts the journal of a snapshot that was just captured and queued
+		self.generation = generation
+		self.active = True
+		self.count = 0
+		self.values.clear()
+		autosaver.submit(self.start, generation)
+
+	def start(self, generation):
+		# runs once the snapshot queued before it is on disk, so the file it reuses is no longer needed
+		if self.file:
+			self.file.close()
+		self.file = open(self.path(generation), 'wb', buffering = 0)
+		self.file.write(HEADER.pack(MAGIC, JOURNAL_VERSION, generation))
+
+	def append(self, data):
+		# the file is unbuffered, so every write reaches the OS even if the game crashes right after
+		if self.file:
+			self.file.write(data)
+
+	def read(self, generation):
+		try:
+			with open(self.path(generation), 'rb') as file:
+				data = file.read()
+		except OSError:
+			return []
+		if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, JOURNAL_VERSION, generation):
+			return []
+
+		# stop at the first record that was cut short or does not match its checksum
+		records = []
+		for offset in range(HEADER.size, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+			payload = data[offset:offset + PAYLOAD.size]
+			if zlib.crc32(payload) != CRC.unpack_from(data, offset + PAYLOAD.size)[0]:
+				break
+			records.append(PAYLOAD.unpack(payload))
+		return records
+
+	def replay(self, level, generation):
+		records = self.read(generation)
+		soil = level.soil_layer
+		player = level.player
+		trees = level.tree_sprites.sprites()
+
+		for kind, flag, x, y, value in records:
+			pos = (x * TILE_SIZE, y * TILE_SIZE)
+			if kind == TILL:
+				soil.till(x, y, flag)
+			elif kind == WATER:
+				soil.water(pos)
+			elif kind == PLANT:
+				soil.plant_seed(pos, CROPS[flag])
+			elif kind == HARVEST and (x, y) in soil.plant_tiles:
+				soil.plant_tiles[(x, y)].kill()
+				soil.remove_plant(pos)
+			elif kind == DAMAGE:
+				tree = trees[value]
+				tree.health = max(tree.health - 1, 0)
+				if flag:
+					for apple in tree.apple_sprites.sprites():
+						if apple.rect.topleft == (tree.rect.left + x, tree.rect.top + y):
+							apple.kill()
+							break
+				if tree.health <= 0 and tree.alive:
+					tree.become_stump()
+			elif kind == MONEY:
+				player.money = value
+			elif kind == ITEM:
+				player.item_inventory[ITEMS[flag]] = value
+			elif kind == SEED:
+				player.seed_inventory[SEEDS[flag]] = value
+			elif kind == POSITION:
+				place(player, x, y)
+
+		self.generation = generation
+		return len(records)
+
+	def remove(self):
+		self.active = False
+		self.buffer.clear()
+		autosaver.submit(self.delete)
+
+	def delete(self):
+		if self.file:
+			self.file.close()
+			self.file = None
+		for generation in (0, 1):
+			if os.path.exists(self.path(generation)):
+				os.remove(self.path(generation))
@@ -1,17 +1,25 @@
+import os
 import pygame 
 import random
 from settings import *
-from player import Player
+from player import Player, ScriptedKeys
 from overlay import Overlay
-from sprites import Generic, Water, WildFlower, Tree, Interaction, Particle
-from pytmx.util_pygame import load_pygame
+from sprites import Generic, Water, WildFlower, Tree, Interaction
+from map_loader import load_map
 from support import *
 from transition import Transition
 from soil import SoilLayer
 from sky import Rain, Sky
 from random import randint
 from menu import Menu
-from llm_agent import LLMDecisionAgent
+from llm_agent import LLMDecisionAgent, LocalDecisionBackend
+from timer import use_simulated_clock, use_wall_clock, advance_clock
+from spatial import SpatialHash, CollisionGroup
+from particles import ParticleEngine
+from profiler import profiler
+from audit import auditor
+from snapshot import autosaver, capture, parse, restore, read_snapshot
+from journal import Journal
 
 class PlayEnemy(Player):
     def __init__(self, pos, group, collision_sprites, tree_sprites, interaction, soil_layer, toggle_shop_ui, id=1):
@@ -28,7 +36,7 @@ class PlayEnemy(Player):
         # Movement attributes
         self.direction = pygame.math.Vector2()
         self.pos = pygame.math.Vector2(self.rect.center)
-        self.speed = 100
+        self.speed = ENEMY_SPEED
 
     # import assets
     def import_assets(self):
@@ -77,16 +85,29 @@ class PlayEnemy(Player):
         self.animate(dt)
 
 class Level:
-    def __init__(self):
+    def __init__(self, headless=False, save_path=None):
+        # a headless level has no window, no audio and a simulated clock,
+        # so days can be played through faster than real time
+        self.headless = headless
+        if headless:
+            use_simulated_clock()
+            pygame.font.init()
+        else:
+            use_wall_clock()
         self.display_surface = pygame.display.get_surface()
 
         # sprite groups
         self.all_sprites = CameraGroup()
-        self.collision_sprites = pygame.sprite.Group()
+        self.collision_sprites = CollisionGroup()
         self.tree_sprites = pygame.sprite.Group()
         self.interaction_sprites = pygame.sprite.Group()
 
-        self.soil_layer = SoilLayer(self.all_sprites, self.collision_sprites)
+        # save journal, only written to once the level has a save to add to
+        self.save_path = save_path
+        self.journal = Journal(save_path)
+        self.journal_time = 0
+
+        self.soil_layer = SoilLayer(self.all_sprites, self.collision_sprites, self.journal)
         self.setup()
         self.overlay = Overlay(self.player)
         self.transition = Transition(self.reset, self.player)
@@ -102,42 +123,109 @@ class Level:
         self.shop_active = False
 
         # music
-        pygame.mixer.init()
+        if not headless:
+            pygame.mixer.init()
         
-        self.success = pygame.mixer.Sound('../audio/success.wav')
+        self.success = self.load_sound('../audio/success.wav')
         self.success.set_volume(0.3)
-        self.music = pygame.mixer.Sound('../audio/music.mp3')
+        self.music = self.load_sound('../audio/music.mp3')
         self.music.play(loops=-1)
 
         # weather music
-        self.rain_music = pygame.mixer.Sound('../audio/rain.mp3')
+        self.rain_music = self.load_sound('../audio/rain.mp3')
         self.rain_music.set_volume(0.7)
-        self.rain_channel = pygame.mixer.Channel(1)
+        self.rain_channel = self.load_channel(1)
 
-        self.sun_music = pygame.mixer.Sound('../audio/day.mp3')
+        self.sun_music = self.load_sound('../audio/day.mp3')
         self.sun_music.set_volume(0.7)
-        self.sun_channel = pygame.mixer.Channel(2)
+        self.sun_channel = self.load_channel(2)
 
         self.update_weather_music()
 
-        # decision agent
-        self.decision_agent = LLMDecisionAgent() 
+        # decision agent, the local rule keeps headless runs off the network
+        self.decision_agent = LocalDecisionBackend() if headless else LLMDecisionAgent()
+        self.decision_request = None
+
+        # scripted input
+        if headless:
+            self.player.key_source = ScriptedKeys()
+
+        # saved farm, picked up where the last session left it, then compacted into a fresh snapshot
+        if save_path:
+            self.load()
+            self.save()
+
+    def save(self, wait=False):
+        # captured on the game thread, compressed and written by the autosave thread,
+        # while the journal moves on to the records that follow this snapshot
+        if not self.save_path:
+            return
+        generation = self.journal.generation + 1
+
+        # queued in order: the records before the capture, the snapshot, then its new journal
+        self.journal.flush()
+        autosaver.request(self.save_path, capture(self), generation)
+        self.journal.rotate(generation)
+        self.journal_time = 0
+        if wait:
+            autosaver.wait()
+
+    def load(self):
+        # a previous level may still be writing this save
+        autosaver.wait()
+        saved = read_snapshot(self.save_path)
+        if saved is None:
+            return False
+        body, generation = saved
+        state = parse(self, body)
+        if state is None:
+            return False
+        restore(self, state)
+        self.journal.replay(self, generation)
+        return True
+
+    def clear_save(self):
+        if not self.save_path:
+            return
+        self.journal.remove()
+        autosaver.wait()
+        if os.path.exists(self.save_path):
+            os.remove(self.save_path)
+
+        # detached, so quitting from the game over screen cannot write the finished game back
+        self.save_path = None
+
+    def load_sound(self, path):
+        return NullSound() if self.headless else pygame.mixer.Sound(path)
+
+    def load_channel(self, id):
+        return NullSound() if self.headless else pygame.mixer.Channel(id)
 
     def setup(self):
-        tmx_data = load_pygame('../data/map.tmx')
+        tmx_data = load_map('../data/map.tmx')
 
-        # house 
+        # house floor and furniture are baked into chunks below everything that moves
+        house_bottom = []
         for layer in ['HouseFloor', 'HouseFurnitureBottom']:
             for x, y, surf in tmx_data.get_layer_by_name(layer).tiles():
-                Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.all_sprites, LAYERS['house bottom'])
+                house_bottom.append(((x * TILE_SIZE,y * TILE_SIZE), surf))
+        for pos, surf in bake_chunks(house_bottom, CHUNK_SIZE, CHUNK_SIZE):
+            Generic(pos, surf, self.all_sprites, LAYERS['house bottom'])
 
+        # walls, furniture and fences share the main layer with the player, so they are
+        # baked into one tile high strips that y-sort exactly like the tiles they replace
+        main_tiles = []
         for layer in ['HouseWalls', 'HouseFurnitureTop']:
             for x, y, surf in tmx_data.get_layer_by_name(layer).tiles():
-                Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.all_sprites)
+                main_tiles.append(((x * TILE_SIZE,y * TILE_SIZE), surf))
 
         # fence
         for x, y, surf in tmx_data.get_layer_by_name('Fence').tiles():
-            Generic((x * TILE_SIZE,y * TILE_SIZE), surf, [self.all_sprites, self.collision_sprites])
+            main_tiles.append(((x * TILE_SIZE,y * TILE_SIZE), surf))
+            Generic((x * TILE_SIZE,y * TILE_SIZE), surf, self.collision_sprites)
+
+        for pos, surf in bake_chunks(main_tiles, CHUNK_SIZE, TILE_SIZE):
+            Generic(pos, surf, self.all_sprites)
 
         # water 
         water_frames = import_folder('../graphics/water')
@@ -145,13 +233,15 @@ class Level:
             Water((x * TILE_SIZE,y * TILE_SIZE), water_frames, self.all_sprites)
 
         # trees 
-        for obj in tmx_data.get_layer_by_name('Trees'):
+        for index, obj in enumerate(tmx_data.get_layer_by_name('Trees')):
             Tree(
                 pos = (obj.x, obj.y), 
                 surf = obj.image, 
                 groups = [self.all_sprites, self.collision_sprites, self.tree_sprites], 
                 name = obj.name,
-                player_add = self.player_add)
+                player_add = self.player_add,
+                index = index,
+                journal = self.journal)
 
         # wildflowers 
         for obj in tmx_data.get_layer_by_name('Decoration'):
@@ -187,11 +277,9 @@ class Level:
             if obj.name == 'Trader':
                 Interaction((obj.x,obj.y), (obj.width,obj.height), self.interaction_sprites, obj.name)
 
-        Generic(
-            pos = (0,0),
-            surf = pygame.image.load('../graphics/world/ground.png').convert_alpha(),
-            groups = self.all_sprites,
-            z = LAYERS['ground'])
+        ground = load_image('../graphics/world/ground.png')
+        for pos, surf in split_chunks(ground, CHUNK_SIZE, CHUNK_SIZE):
+            Generic(pos, surf, self.all_sprites, LAYERS['ground'])
 
     def player_add(self, item):
         self.player.item_inventory[item] += 1
@@ -236,48 +324,131 @@ class Level:
         # update weather music
         self.update_weather_music()
 
-        # decision agent
-        self.raining = self.decision_agent.decide(self.player.money)
+        # decision agent, answered in the background while the night goes on
+        self.decision_request = self.decision_agent.decide_async(self.player.money)
+
+        # debug audit of the sprites that survived the night
+        auditor.on_reset(self)
+
+        # a new day is always saved
+        self.save()
+
+    def poll_decision(self):
+        if self.decision_request and self.decision_request.done():
+            self.raining = self.decision_request.result(self.raining)
+            self.decision_request = None
+
+            # the day's weather is only settled now, so the nightly save is taken again
+            self.save()
 
     # plant collision
     def plant_collision(self):
-        if self.soil_layer.plant_sprites:
-            for plant in self.soil_layer.plant_sprites.sprites():
-                if plant.harvestable and plant.rect.colliderect(self.player.hitbox):
-                    self.player_add(plant.plant_type)
-                    plant.kill()
-                    Particle(plant.rect.topleft, plant.image, self.all_sprites, z = LAYERS['main'])
-                    self.soil_layer.grid[plant.rect.centery // TILE_SIZE][plant.rect.centerx // TILE_SIZE].remove('P')
+        for plant in self.soil_layer.harvestable_plants(self.player.hitbox):
+            if plant.rect.colliderect(self.player.hitbox):
+                self.harvest(plant)
+
+    def harvest(self, plant):
+        self.player_add(plant.plant_type)
+        plant.kill()
+        self.all_sprites.particles.spawn(plant.rect.topleft, plant.image, LAYERS['main'])
+        self.soil_layer.remove_plant(plant.soil.rect.center)
+        self.journal.harvest(*self.soil_layer.get_cell(plant.soil.rect.center))
+
+    def handle_events(self, events):
+        # input is handled once per rendered frame, however many steps follow
+        if self.shop_active:
+            with profiler.section('menu'):
+                self.menu.update(events)
 
-    def run(self, dt, events):
-        self.player_enemy.set_play_pos(self.player.pos)
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+            self.player.handle_event(event, self.menu)
 
-        self.display_surface.fill('black')
-        self.all_sprites.custom_draw(self.player)
+    def update(self, dt):
+        if self.headless:
+            advance_clock(dt)
+
+        self.player_enemy.set_play_pos(self.player.pos)
         self.player.check_enemy_pos(self.player_enemy.pos)
-        
-        # update shop
+
+        # the world stands still while the shop is open
         if self.shop_active:
-            self.menu.update(events)
+            self.all_sprites.settle()
         else:
-            self.all_sprites.update(dt)
-            self.plant_collision()
-
-        for event in events:
-            self.player.handle_event(event, self.menu)
+            with profiler.section('sprites update'):
+                self.all_sprites.update(dt)
+            if self.display_surface:
+                with profiler.section('rain'):
+                    self.rain.update(dt, self.raining)
+            with profiler.section('plant collision'):
+                self.plant_collision()
 
         # weather
-        self.overlay.display()
-        if self.raining and not self.shop_active:
-            self.rain.update()
-        self.sky.display(dt)
+        self.sky.update(dt)
 
         # music
+        with profiler.section('llm poll'):
+            self.poll_decision()
         self.update_weather_music()
 
         # transition
         if self.player.sleep:
-            self.transition.play()
+            self.transition.update(dt)
+
+        # autosave, a few journal records per second of play and a new snapshot once the journal grows long
+        self.journal_time += dt
+        if self.journal_time >= JOURNAL_FLUSH:
+            self.journal_time = 0
+            self.journal.track_player(self.player)
+            self.journal.flush()
+            if self.journal.count >= JOURNAL_COMPACT:
+                self.save()
+
+    def draw(self, alpha=1):
+        # headless runs only draw when given an offscreen display, as benchmarks do
+        if not self.display_surface:
+            return
+
+        self.display_surface.fill('black')
+        with profiler.section('custom draw'):
+            self.all_sprites.custom_draw(self.player, alpha)
+
+        if self.shop_active:
+            with profiler.section('menu'):
+                self.menu.display()
+
+        self.overlay.display()
+        with profiler.section('sky'):
+            self.sky.display()
+
+        if self.player.sleep:
+            self.transition.display()
+
+        profiler.display(self.display_surface)
+
+    def run(self, dt, events):
+        self.handle_events(events)
+        self.update(dt)
+        self.draw()
+        self.end_frame()
+
+    def end_frame(self):
+        profiler.end_frame(self)
+        auditor.end_frame(self)
+
+    def sprite_counts(self):
+        groups = {
+            'all': len(self.all_sprites),
+            'collision': len(self.collision_sprites),
+            'trees': len(self.tree_sprites),
+            'soil': len(self.soil_layer.soil_sprites),
+            'water': len(self.soil_layer.water_sprites),
+            'plants': len(self.soil_layer.plant_sprites),
+            'particles': len(self.all_sprites.particles)}
+        layer_names = {z: name for name, z in LAYERS.items()}
+        layers = {layer_names.get(z, z): len(sprites) for z, sprites in self.all_sprites.layers.items() if sprites}
+        return {'groups': groups, 'layers': layers}
 
 class CameraGroup(pygame.sprite.Group):
     def __init__(self):
@@ -285,13 +456,133 @@ class CameraGroup(pygame.sprite.Group):
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.math.Vector2()
 
-    def custom_draw(self, player):
-        self.offset.x = player.rect.centerx - SCREEN_WIDTH / 2
-        self.offset.y = player.rect.centery - SCREEN_HEIGHT / 2
+        # one bucket per z, kept up to date as sprites come and go; draws take their layer from here
+        self.layers = {z: {} for z in sorted(LAYERS.values())}
+        self.sprite_layers = {}
+        self.order = {}
+        self.counter = 0
+
+        # spatial index for culling draws and cosmetic updates to the camera
+        self.spatial = SpatialHash(TILE_SIZE)
+        self.active_sprites = {}
+        self.cosmetic_sprites = set()
+
+        # sprites set their z after joining their groups, so they are filed on the next draw
+        self.pending = []
+
+        # batched draws (rain, particles) that are not sprites but share the depth order
+        self.renderers = {}
+        self.particles = ParticleEngine(self)
+
+        # where moving sprites stood before the last step, to draw between steps
+        self.previous = {}
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.pending.append(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        z = self.sprite_layers.pop(sprite, None)
+        if z is not None:
+            self.unfile(sprite, z)
+            del self.order[sprite]
+            self.spatial.remove(sprite)
+            self.active_sprites.pop(sprite, None)
+            self.cosmetic_sprites.discard(sprite)
+        elif sprite in self.pending:
+            self.pending.remove(sprite)
+
+    def file(self, sprite, z):
+        self.sprite_layers[sprite] = z
+        self.layers.setdefault(z, {})[sprite] = None
+
+    def unfile(self, sprite, z):
+        del self.layers[z][sprite]
+
+    def file_pending(self):
+        for sprite in self.pending:
+            self.file(sprite, sprite.z)
+            self.order[sprite] = self.counter
+            self.counter += 1
+            self.spatial.insert(sprite, sprite.rect)
+
+            # sprites without their own update never need one
+            if getattr(sprite, 'cosmetic', False):
+                self.cosmetic_sprites.add(sprite)
+            elif type(sprite).update is not pygame.sprite.Sprite.update:
+                self.active_sprites[sprite] = None
+        self.pending.clear()
+
+    def refresh(self, sprite):
+        # re-file a sprite after its z or rect changed outside of update
+        z = self.sprite_layers.get(sprite)
+        if z is None:
+            return
+        if z != sprite.z:
+            self.unfile(sprite, z)
+            self.file(sprite, sprite.z)
+        self.spatial.move(sprite, sprite.rect)
+
+    def add_renderer(self, z, renderer):
+        self.renderers.setdefault(z, []).append(renderer)
+
+    def view_rect(self):
+        rect = pygame.Rect(round(self.offset.x), round(self.offset.y), SCREEN_WIDTH, SCREEN_HEIGHT)
+        return rect.inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+
+    def settle(self):
+        self.previous.clear()
+
+    def draw_rect(self, sprite, lag):
+        rect = sprite.rect.copy()
+        previous = self.previous.get(sprite)
+        if lag and previous:
+            rect.x -= round((rect.x - previous[0]) * lag)
+            rect.y -= round((rect.y - previous[1]) * lag)
+        return rect
 
-        for layer in sorted(LAYERS, key=lambda x: LAYERS[x]):
-            for sprite in sorted(self.sprites(), key=lambda sprite: sprite.rect.centery):
-                if sprite.z == LAYERS[layer]:
-                    offset_rect = sprite.rect.copy()
-                    offset_rect.center -= self.offset
-                    self.display_surface.blit(sprite.image, offset_rect)
+    def update(self, dt):
+        self.file_pending()
+        self.particles.update(dt)
+        self.previous = {sprite: sprite.rect.topleft for sprite in self.active_sprites}
+
+        for sprite in list(self.active_sprites):
+            sprite.update(dt)
+            if sprite in self.spatial:
+                self.spatial.move(sprite, sprite.rect)
+
+        # water animation only matters where the camera can see it
+        for sprite in self.spatial.query(self.view_rect()) & self.cosmetic_sprites:
+            sprite.update(dt)
+            if sprite in self.spatial:
+                self.spatial.move(sprite, sprite.rect)
+
+    def custom_draw(self, player, alpha=1):
+        # alpha is how far the frame lies between the last two simulation steps
+        lag = 1 - alpha
+        player_rect = self.draw_rect(player, lag)
+        self.offset.x = player_rect.centerx - SCREEN_WIDTH / 2
+        self.offset.y = player_rect.centery - SCREEN_HEIGHT / 2
+        self.file_pending()
+
+        # only what the camera sees is grouped and sorted, so the cost follows the view, not the map
+        layers = {}
+        for sprite in self.spatial.query(self.view_rect()):
+            layers.setdefault(self.sprite_layers[sprite], []).append(sprite)
+
+        order = self.order
+        for z in sorted(layers.keys() | self.renderers.keys()):
+            sprites = layers.get(z, [])
+            if z == LAYERS['main']:
+                sprites.sort(key=lambda sprite: (sprite.rect.centery, order[sprite]))
+            else:
+                sprites.sort(key=order.__getitem__)
+
+            for sprite in sprites:
+                offset_rect = self.draw_rect(sprite, lag)
+                offset_rect.center -= self.offset
+                self.display_surface.blit(sprite.image, offset_rect)
+
+            for renderer in self.renderers.get(z, ()):
+                renderer(self.display_surface, self.offset, lag * FIXED_DT)
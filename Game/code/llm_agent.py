@@ -1,74 +1,418 @@
+import time
+import heapq
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from openai import OpenAI
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Optional, Hashable, Tuple
+from settings import *
+
+# request priorities, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# define the request scheduler
+class LLMScheduler:
+    """
+    LLM 请求调度：交互请求优先，相同的请求合并，并发数不超过 workers。
+    """
+    def __init__(self, workers: int = LLM_WORKERS):
+        self.queue: List = []
+        self.inflight: Dict[Hashable, Future] = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = 0
+        self.latencies = {INTERACTIVE: deque(maxlen=LLM_LATENCY_WINDOW), BACKGROUND: deque(maxlen=LLM_LATENCY_WINDOW)}
+
+        # daemon workers, so quitting the game never waits on a slow endpoint
+        for index in range(workers):
+            threading.Thread(target=self.work, name=f'llm-{index}', daemon=True).start()
+
+    def submit(self, work: Callable[[], Any], priority: int = BACKGROUND, key: Optional[Hashable] = None) -> Future:
+        with self.condition:
+            # an identical request already queued or running answers both callers
+            if key is not None and key in self.inflight:
+                return self.inflight[key]
+
+            future = Future()
+            heapq.heappush(self.queue, (priority, next(self.counter), key, work, future, time.monotonic()))
+            if key is not None:
+                self.inflight[key] = future
+            self.condition.notify()
+            return future
+
+    def work(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                priority, _, key, work, future, submitted = heapq.heappop(self.queue)
+                self.running += 1
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(work())
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.running -= 1
+                    if key is not None:
+                        self.inflight.pop(key, None)
+                    self.latencies[priority].append(time.monotonic() - submitted)
+
+    def queue_depth(self) -> int:
+        with self.condition:
+            return len(self.queue)
+
+    def percentiles(self, priority: int) -> Dict[str, float]:
+        # latency from submit to answer in seconds, queueing included
+        with self.condition:
+            samples = sorted(self.latencies[priority])
+        if not samples:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        pick = lambda fraction: samples[min(int(fraction * len(samples)), len(samples) - 1)]
+        return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self.queue_depth(),
+            'running': self.running,
+            'interactive': self.percentiles(INTERACTIVE),
+            'background': self.percentiles(BACKGROUND),
+        }
+
+# shared scheduler, so no HTTP call ever runs on the game loop thread
+scheduler = LLMScheduler()
+
+# define a background request
+class LLMRequest:
+    """
+    后台请求：游戏循环每帧轮询，可以超时和取消。
+    """
+    def __init__(self, timeout: float = LLM_TIMEOUT):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.cancelled = False
+        self.future = None
+        self.shared = False
+
+        # text streamed in so far, read by the game loop while the reply is still coming
+        self.partial = ''
+
+    def start(self, work: Callable[[], Any], priority: int = BACKGROUND, key: Optional[Hashable] = None) -> "LLMRequest":
+        self.future = scheduler.submit(work, priority, key)
+        self.shared = key is not None
+        return self
+
+    def finish(self, result: Any) -> "LLMRequest":
+        # a request that was answered without going to the network
+        self.future = Future()
+        self.future.set_result(result)
+        return self
+
+    def keep_alive(self) -> None:
+        # a streaming reply only times out when it stops producing tokens
+        self.deadline = time.monotonic() + self.timeout
+
+    def timed_out(self) -> bool:
+        return not self.future.done() and time.monotonic() > self.deadline
+
+    def done(self) -> bool:
+        return self.cancelled or self.future.done() or self.timed_out()
+
+    def cancel(self) -> None:
+        # a request already on the wire cannot be stopped, its result is dropped instead
+        self.cancelled = True
+        if not self.shared:
+            self.future.cancel()
+
+    def result(self, default: Any = None) -> Any:
+        if self.cancelled or not self.future.done():
+            return default
+        return self.future.result()
+
+def estimate_tokens(text: str) -> int:
+    # CJK characters are roughly a token each, other text about four characters a token
+    wide = sum(1 for char in text if ord(char) > 127)
+    return wide + (len(text) - wide) // 4 + 4
+
+# define a bounded conversation
+class ConversationContext:
+    """
+    对话上下文：始终保留系统提示，超出 token 预算时把最早的对话压缩成摘要。
+    """
+    def __init__(self, system_prompt: str, token_budget: int = LLM_TOKEN_BUDGET, summary_budget: int = LLM_SUMMARY_BUDGET):
+        self.system = {"role": "system", "content": system_prompt}
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.turns: List[Dict] = []
+        self.summary: List[str] = []
+
+    def append(self, role: str, content: str) -> Dict:
+        turn = {"role": role, "content": content}
+        self.turns.append(turn)
+        self.trim()
+        return turn
+
+    def remove(self, *turns: Dict) -> None:
+        # by identity, a turn may already have been summarised away or have others after it
+        self.turns = [turn for turn in self.turns if not any(turn is removed for removed in turns)]
+
+    def summary_message(self) -> Dict:
+        return {"role": "system", "content": "之前的对话摘要：" + "；".join(self.summary)}
+
+    def messages(self) -> List[Dict]:
+        messages = [self.system]
+        if self.summary:
+            messages.append(self.summary_message())
+        return messages + self.turns
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(message["content"]) for message in self.messages())
+
+    def trim(self) -> None:
+        # the newest turn always stays, everything older is summarised away oldest first
+        while len(self.turns) > 1 and self.tokens() > self.token_budget:
+            turn = self.turns.pop(0)
+            speaker = "玩家" if turn["role"] == "user" else "商人"
+            self.summary.append(speaker + "：" + turn["content"][:40])
+
+            while len(self.summary) > 1 and estimate_tokens(self.summary_message()["content"]) > self.summary_budget:
+                self.summary.pop(0)
+
+# one client for the whole process, its connection pool keeps the endpoint alive across levels
+shared_client: Optional[OpenAI] = None
+client_lock = threading.Lock()
+
+def get_client() -> OpenAI:
+    global shared_client
+    with client_lock:
+        if shared_client is None:
+            shared_client = OpenAI(
+                base_url=LLM_BASE_URL,
+                api_key=LLM_API_KEY,
+                timeout=LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+            )
+        return shared_client
 
 # define a base agent
 class LLMAgent:
     def __init__(self):
-        self.client = OpenAI(
-            base_url='http://10.15.88.73:5023/v1',
-            api_key='ollama', 
-        )
+        self.client = get_client()
+        self.model = LLM_MODEL
 
 # define chat agent as a sub class
 class LLMChatAgent(LLMAgent):
     def __init__(self):
         super().__init__()
-        self.messages: List[Dict] = [
-            {"role": "system", "content": (
-                "主角：通过种果实、砍木材、摘苹果并进行售卖来获取金币。\n"
-                "商人：你可以在商店购买种子和出售已有商品。\n"
-                "捣蛋鬼：如果捣蛋鬼每追上你一次，你的金币就会少10个。"
-            )}
-        ]
+        self.context = ConversationContext(
+            "主角：通过种果实、砍木材、摘苹果并进行售卖来获取金币。\n"
+            "商人：你可以在商店购买种子和出售已有商品。\n"
+            "捣蛋鬼：如果捣蛋鬼每追上你一次，你的金币就会少10个。"
+        )
+
+        # a cancelled request keeps running in the background, so the next exchange
+        # waits for it instead of interleaving its turns with the history
+        self.lock = threading.Lock()
+
+    def exchange(self, user_message: str) -> Tuple[str, Tuple[Dict, Dict]]:
+        with self.lock:
+            user_turn = self.context.append("user", user_message)
+
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.context.messages(),
+                )
+                assistant_reply = response.choices[0].message.content.strip()
+            except Exception as e:
+                assistant_reply = "抱歉，发生了一个错误。"
+
+            assistant_turn = self.context.append("assistant", assistant_reply)
+            return assistant_reply, (user_turn, assistant_turn)
 
     def send_message(self, user_message: str) -> str:
         """
         发送用户消息并获取助手回复。
         """
-        self.messages.append({"role": "user", "content": user_message})
+        return self.exchange(user_message)[0]
 
-        try:
-            response = self.client.chat.completions.create(
-                model="llama3.2",
-                messages=self.messages,
-            )
-            assistant_reply = response.choices[0].message.content.strip()
-        except Exception as e:
-            assistant_reply = "抱歉，发生了一个错误。"
+    def send_message_async(self, user_message: str) -> LLMRequest:
+        """
+        在后台发送用户消息，立即返回请求对象。
+        """
+        request = LLMRequest()
+
+        def work():
+            assistant_reply, turns = self.exchange(user_message)
+            if request.cancelled or request.timed_out():
+                # the player never saw this exchange, so keep it out of the history
+                with self.lock:
+                    self.context.remove(*turns)
+            return assistant_reply
+
+        return request.start(work, INTERACTIVE)
+
+    def stream_message(self, user_message: str, request: LLMRequest) -> str:
+        """
+        以流式方式发送用户消息，逐个 token 写入 request.partial。
+        """
+        with self.lock:
+            user_turn = self.context.append("user", user_message)
+
+            try:
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.context.messages(),
+                    stream=True,
+                )
+                for chunk in stream:
+                    if request.cancelled:
+                        stream.close()
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        request.partial += chunk.choices[0].delta.content
+                        request.keep_alive()
+                assistant_reply = request.partial.strip()
+            except Exception as e:
+                assistant_reply = "抱歉，发生了一个错误。"
+
+            # a reply cancelled before its first token never reached the player
+            if not assistant_reply:
+                self.context.remove(user_turn)
+                return assistant_reply
+
+            self.context.append("assistant", assistant_reply)
+            return assistant_reply
+
+    def stream_message_async(self, user_message: str) -> LLMRequest:
+        """
+        在后台流式发送用户消息，立即返回请求对象。
+        """
+        request = LLMRequest()
+        return request.start(lambda: self.stream_message(user_message, request), INTERACTIVE)
+
+# define a local decision backend
+class LocalDecisionBackend:
+    """
+    本地规则：奇数下雨，偶数不下雨，不需要网络。
+    """
+    def decide(self, money: int) -> bool:
+        return int(money) % 2 == 1
 
-        self.messages.append({"role": "assistant", "content": assistant_reply})
-        return assistant_reply
+    def decide_async(self, money: int) -> LLMRequest:
+        return LLMRequest().finish(self.decide(money))
+
+# define a circuit breaker for a slow or unreachable endpoint
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, latency_threshold: float = LLM_BREAKER_LATENCY, probe_interval: float = LLM_BREAKER_PROBE):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.probe_interval = probe_interval
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.probe_interval
+
+    def allow(self) -> bool:
+        # while open, one probe is let through every probe_interval
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.probe_interval:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float = 0.0) -> None:
+        with self.lock:
+            if ok and latency <= self.latency_threshold:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
 
 # define decision agent as a sub class
 class LLMDecisionAgent(LLMAgent):
-    def __init__(self):
+    def __init__(self, fallback: LocalDecisionBackend = None):
         super().__init__()
-        self.messages: List[Dict] = [
-            {"role": "system", "content": 
-            "根据我输出的数字，如果输入的数字是奇数，则输出1，如果输入的数字是偶数，输出2，只输出一个字符"
-            }
+        self.system_prompt = "根据我输出的数字，如果输入的数字是奇数，则输出1，如果输入的数字是偶数，输出2，只输出一个字符"
+
+        # answers are memoised, and the local rule takes over while the endpoint is unhealthy
+        self.fallback = fallback or LocalDecisionBackend()
+        self.breaker = CircuitBreaker()
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def cache_key(self, money: int) -> str:
+        return str(int(money))
+
+    def cached(self, money: int) -> Optional[bool]:
+        with self.cache_lock:
+            key = self.cache_key(money)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            return None
+
+    def remember(self, money: int, raining: bool) -> None:
+        with self.cache_lock:
+            self.cache[self.cache_key(money)] = raining
+            while len(self.cache) > LLM_DECISION_CACHE:
+                self.cache.popitem(last=False)
+
+    def ask_model(self, money: int) -> bool:
+        # every decision stands alone, so the prompt never grows
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.cache_key(money)},
         ]
 
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        reply = int(response.choices[0].message.content.strip())
+        if reply not in (1, 2):
+            raise ValueError(f"unexpected decision reply: {reply}")
+        return reply == 1
+
     def decide(self, money: int) -> bool:
-        self.messages.append({"role": "user", "content": str(money)})
+        raining = self.cached(money)
+        if raining is not None:
+            return raining
+
+        if not self.breaker.allow():
+            return self.fallback.decide(money)
 
+        start = time.monotonic()
         try:
-            response = self.client.chat.completions.create(
-                model="llama3.2",
-                messages=self.messages,
-            )
-            assistant_reply = response.choices[0].message.content.strip()
-            reply = int(assistant_reply)
+            raining = self.ask_model(money)
         except Exception as e:
             print(f"Error during decision: {e}")
-            return False
+            self.breaker.record(False)
+            return self.fallback.decide(money)
 
-        self.messages.append({"role": "assistant", "content": assistant_reply})
-
-        if reply == 1:
-            raining = True
-        else:
-            raining = False
+        self.breaker.record(True, time.monotonic() - start)
+        self.remember(money, raining)
         return raining
 
+    def decide_async(self, money: int) -> LLMRequest:
+        # answered on the spot whenever the network would not be used anyway
+        raining = self.cached(money)
+        if raining is not None:
+            return LLMRequest().finish(raining)
+        if self.breaker.is_open():
+            return LLMRequest().finish(self.fallback.decide(money))
+        return LLMRequest().start(lambda: self.decide(money), BACKGROUND, ('decide', self.cache_key(money)))
+
 print("LLMDecisionAgent loaded successfully")
@@ -63,16 +63,38 @@ class GameVictoryScreen:
 class Game:
     def __init__(self):
         pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.screen = self.create_screen()
         pygame.display.set_caption('Harvest Moonlight')
         self.clock = pygame.time.Clock()
-        self.level = Level()
+        self.accumulator = 0
+        self.level = Level(save_path=SAVE_PATH)
 
         self.start_screen = StartScreen(self.screen)
         self.instructions_screen  = InstructionsScreen(self.screen)
         self.game_over_screen = GameOverScreen(self.screen)
         self.game_victory_screen = GameVictoryScreen(self.screen)
 
+    def create_screen(self):
+        if RENDER_MODE == 'vsync':
+            # vsync needs a renderer backed window, fall back to a plain one without it
+            try:
+                return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED, vsync=1)
+            except pygame.error:
+                pass
+        return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    def step(self, events):
+        # fixed simulation steps, however long the frame took to render
+        frame_time = self.clock.tick(RENDER_FPS if RENDER_MODE == 'capped' else 0) / 1000
+        self.accumulator += min(frame_time, MAX_FRAME_TIME)
+
+        self.level.handle_events(events)
+        while self.accumulator >= FIXED_DT:
+            self.level.update(FIXED_DT)
+            self.accumulator -= FIXED_DT
+        self.level.draw(self.accumulator / FIXED_DT)
+        self.level.end_frame()
+
     def run(self):
         game_started = False
         game_over = False
@@ -84,6 +106,7 @@ class Game:
             events = pygame.event.get()
             for event in events:
                 if event.type == pygame.QUIT:
+                    self.level.save(wait=True)
                     pygame.quit()
                     sys.exit()
 
@@ -95,7 +118,7 @@ class Game:
                             # if game over, restart the game
                             game_started = False
                             game_over = False
-                            self.level = Level()
+                            self.level = Level(save_path=SAVE_PATH)
 
                     # press space to view instructions
                     if event.key == pygame.K_SPACE and not game_started and not game_over:
@@ -117,16 +140,17 @@ class Game:
                 # if not game started, display start screen
                 self.start_screen.display()
             else:
-                dt = self.clock.tick(60) / 1000
-                self.level.run(dt, events)
+                self.step(events)
                 # check if player is dead
-                if self.level.player.money < 100:
+                if self.level.player.money < BANKRUPT_MONEY:
                     self.level.player.money = 10000
+                    self.level.clear_save()
                     game_over = True
 
-                if self.level.player.money > 11000:
+                if self.level.player.money > WIN_MONEY:
                     gave_victory = True
                     print('金币超过上限，游戏结束！')
+                    self.level.clear_save()
                     game_over = True
 
             pygame.display.update()
@@ -0,0 +1,154 @@
+import os
+import pickle
+import pygame
+from array import array
+from collections import namedtuple
+
+# bump when the cached model layout changes
+CACHE_VERSION = 1
+
+MapObject = namedtuple('MapObject', ['name', 'x', 'y', 'width', 'height', 'image'])
+
+class TileLayer:
+	def __init__(self, name, width, data, images):
+		self.name = name
+		self.width = width
+		self.data = data
+		self.images = images
+
+	def tiles(self):
+		width = self.width
+		for index, tile in enumerate(self.data):
+			if tile:
+				yield index % width, index // width, self.images[tile]
+
+class ObjectLayer(list):
+	def __init__(self, name, objects):
+		super().__init__(objects)
+		self.name = name
+
+class MapData:
+	def __init__(self, model):
+		self.width = model['width']
+		self.height = model['height']
+		self.tile_size = model['tile_size']
+
+		# tile 0 is empty, the rest are shared by every layer that uses them
+		display = pygame.display.get_surface() is not None
+		self.images = [None]
+		for size, pixels in model['images']:
+			surf = pygame.image.frombytes(pixels, size, 'RGBA')
+			self.images.append(surf.convert_alpha() if display else surf)
+
+		self.layers = {}
+		for layer_name, data in model['tile_layers'].items():
+			tiles = array('H')
+			tiles.frombytes(data)
+			self.layers[layer_name] = TileLayer(layer_name, self.width, tiles, self.images)
+
+		for layer_name, records in model['object_layers'].items():
+			objects = [MapObject(name, x, y, width, height, self.images[image]) for name, x, y, width, height, image in records]
+			self.layers[layer_name] = ObjectLayer(layer_name, objects)
+
+	def get_layer_by_name(self, name):
+		return self.layers[name]
+
+def image_loader(filename, colorkey, **kwargs):
+	# like pytmx's pygame loader, minus convert(), so a cold cache parses without a window
+	from pytmx.util_pygame import handle_transformation
+
+	image = pygame.image.load(filename)
+	if colorkey:
+		colorkey = pygame.Color(f'#{colorkey}')
+
+	def load_image(rect = None, flags = None):
+		tile = image.subsurface(rect).copy() if rect else image.copy()
+		if flags:
+			tile = handle_transformation(tile, flags)
+		if colorkey:
+			tile.set_colorkey(colorkey)
+		return tile
+
+	return load_image
+
+def build_model(path):
+	# the only place the TMX and its tilesets are parsed
+	from pytmx import TiledMap, TiledTileLayer, TiledObjectGroup
+
+	tmx_data = TiledMap(path, image_loader = image_loader)
+	images = []
+	image_index = {}
+
+	def add_image(surf):
+		if surf is None:
+			return 0
+		if id(surf) not in image_index:
+			# flatten colorkeys and surface alpha into plain per pixel alpha
+			rgba = pygame.Surface(surf.get_size(), pygame.SRCALPHA)
+			rgba.blit(surf, (0,0))
+			images.append((surf.get_size(), pygame.image.tobytes(rgba, 'RGBA')))
+			image_index[id(surf)] = len(images)
+		return image_index[id(surf)]
+
+	tile_layers = {}
+	object_layers = {}
+	for layer in tmx_data.layers:
+		if isinstance(layer, TiledTileLayer):
+			tiles = array('H', bytes(2 * tmx_data.width * tmx_data.height))
+			for x, y, surf in layer.tiles():
+				tiles[y * tmx_data.width + x] = add_image(surf)
+			tile_layers[layer.name] = tiles.tobytes()
+
+		elif isinstance(layer, TiledObjectGroup):
+			object_layers[layer.name] = [
+				(obj.name, obj.x, obj.y, obj.width, obj.height, add_image(obj.image))
+				for obj in layer]
+
+	return {
+		'version': CACHE_VERSION,
+		'width': tmx_data.width,
+		'height': tmx_data.height,
+		'tile_size': tmx_data.tilewidth,
+		'images': images,
+		'tile_layers': tile_layers,
+		'object_layers': object_layers}
+
+def read_cache(cache_path, mtime):
+	try:
+		with open(cache_path, 'rb') as file:
+			model = pickle.load(file)
+	except (OSError, pickle.UnpicklingError, EOFError):
+		return None
+
+	if model.get('version') != CACHE_VERSION or model.get('mtime') != mtime:
+		return None
+	return model
+
+def write_cache(cache_path, model):
+	# a read only install simply parses the TMX every cold start
+	temp_path = cache_path + '.tmp'
+	try:
+		with open(temp_path, 'wb') as file:
+			pickle.dump(model, file, pickle.HIGHEST_PROTOCOL)
+		os.replace(temp_path, cache_path)
+	except OSError:
+		pass
+
+loaded_maps = {}
+
+def load_map(path):
+	# parsed once per process and shared by every Level, including restarts
+	path = os.path.normpath(path)
+	if path in loaded_maps:
+		return loaded_maps[path]
+
+	mtime = os.path.getmtime(path)
+	cache_path = path + '.cache'
+	model = read_cache(cache_path, mtime)
+	if model is None:
+		model = build_model(path)
+		model['mtime'] = mtime
+		write_cache(cache_path, model)
+
+	loaded_maps[path] = MapData(model)
+	return loaded_maps[path]
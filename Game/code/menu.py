@@ -1,6 +1,6 @@
 import pygame
 from settings import *
-from timer import Timer
+from timer import Timer, get_ticks
 from llm_agent import LLMChatAgent
 
 # define colors
@@ -37,6 +37,7 @@ class Menu:
         self.chat_messages = []
         self.chat_input = ''
         self.chat_height = 150
+        self.chat_request = None
 
         # chat agent
         self.llm_chat_agent = LLMChatAgent()
@@ -94,14 +95,24 @@ class Menu:
                 if keys[pygame.K_z]:
                     current_item = self.options[self.index]
                     if self.index <= self.sell_border:
-                        if self.player.item_inventory[current_item] > 0:
-                            self.player.item_inventory[current_item] -= 1
-                            self.player.money += SALE_PRICES[current_item]
+                        self.sell(current_item)
                     else:
-                        seed_price = PURCHASE_PRICES[current_item]
-                        if self.player.money >= seed_price:
-                            self.player.seed_inventory[current_item] += 1
-                            self.player.money -= PURCHASE_PRICES[current_item]
+                        self.buy(current_item)
+
+    def sell(self, item):
+        if self.player.item_inventory[item] > 0:
+            self.player.item_inventory[item] -= 1
+            self.player.money += SALE_PRICES[item]
+            return True
+        return False
+
+    def buy(self, seed):
+        seed_price = PURCHASE_PRICES[seed]
+        if self.player.money >= seed_price:
+            self.player.seed_inventory[seed] += 1
+            self.player.money -= seed_price
+            return True
+        return False
 
     def handle_shop_event(self, event):
         if not self.chat_active:
@@ -115,11 +126,18 @@ class Menu:
         if self.chat_active:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
-                    if self.chat_input.strip():
+                    # while a reply is pending the typed line stays in the box, to be sent afterwards
+                    if self.chat_input.strip() and not self.chat_request:
                         self.chat_messages.append(("玩家", self.chat_input))
-                        assistant_reply = self.llm_chat_agent.send_message(self.chat_input)
-                        self.chat_messages.append(("商人", assistant_reply))
-                    self.chat_input = ''
+                        self.chat_messages.append(("商人", "思考中"))
+                        if LLM_STREAM:
+                            self.chat_request = self.llm_chat_agent.stream_message_async(self.chat_input)
+                        else:
+                            self.chat_request = self.llm_chat_agent.send_message_async(self.chat_input)
+                        self.chat_input = ''
+                elif event.key == pygame.K_ESCAPE:
+                    if self.chat_request:
+                        self.chat_request.cancel()
                 elif event.key == pygame.K_BACKSPACE:
                     self.chat_input = self.chat_input[:-1]
 
@@ -127,6 +145,33 @@ class Menu:
                     if event.unicode.isprintable():
                         self.chat_input += event.unicode
 
+    def poll_chat(self):
+        # the reply arrives in the background, the last message is its placeholder
+        if not self.chat_request:
+            return
+
+        if not self.chat_request.done():
+            if self.chat_request.partial:
+                self.chat_messages[-1] = ("商人", self.chat_request.partial)
+            else:
+                dots = get_ticks() // 300 % 4
+                self.chat_messages[-1] = ("商人", "思考中" + "." * dots)
+            return
+
+        if self.chat_request.cancelled:
+            assistant_reply = self.chat_request.partial + "（已取消）"
+        elif self.chat_request.timed_out():
+            # like a cancel, a streamed reply keeps what the player already saw, which is also what the history keeps
+            self.chat_request.cancel()
+            if self.chat_request.partial:
+                assistant_reply = self.chat_request.partial + "（回复超时）"
+            else:
+                assistant_reply = "抱歉，回复超时。"
+        else:
+            assistant_reply = self.chat_request.result()
+        self.chat_messages[-1] = ("商人", assistant_reply)
+        self.chat_request = None
+
     def show_entry(self, text_surf, amount, top, selected):
         # background
         bg_rect = pygame.Rect(self.main_rect.left, top, self.width, text_surf.get_height() + (self.padding * 2))
@@ -188,10 +233,13 @@ class Menu:
                     self.handle_shop_event(event)
 
         if self.shop_visible:
-            keys = pygame.key.get_pressed()
+            keys = self.player.key_source()
             if not self.chat_active:
                 self.handle_shop_navigation(keys)
 
+        self.poll_chat()
+
+    def display(self):
         self.display_money()
 
         if self.shop_visible:
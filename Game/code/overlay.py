@@ -1,5 +1,6 @@
 import pygame
 from settings import *
+from support import load_image
 
 class Overlay:
 	def __init__(self,player):
@@ -10,8 +11,8 @@ class Overlay:
 
 		# imports 
 		overlay_path = '../graphics/overlay/'
-		self.tools_surf = {tool: pygame.image.load(f'{overlay_path}{tool}.png').convert_alpha() for tool in player.tools}
-		self.seeds_surf = {seed: pygame.image.load(f'{overlay_path}{seed}.png').convert_alpha() for seed in player.seeds}
+		self.tools_surf = {tool: load_image(f'{overlay_path}{tool}.png') for tool in player.tools}
+		self.seeds_surf = {seed: load_image(f'{overlay_path}{seed}.png') for seed in player.seeds}
 
 	def display(self):
 
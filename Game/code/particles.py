@@ -0,0 +1,87 @@
+import pygame
+import numpy as np
+from settings import *
+
+class ParticlePool:
+	def __init__(self, capacity, frames):
+		# fixed size struct of arrays, a full pool drops new particles instead of growing
+		self.capacity = capacity
+		self.frames = frames
+		self.pos = np.zeros((capacity, 2), dtype = np.float32)
+		self.velocity = np.zeros((capacity, 2), dtype = np.float32)
+		self.age = np.zeros(capacity, dtype = np.float32)
+		self.lifetime = np.zeros(capacity, dtype = np.float32)
+		self.frame = np.zeros(capacity, dtype = np.int32)
+		self.alive = np.zeros(capacity, dtype = bool)
+
+	def spawn(self, pos, velocity, lifetime, frame):
+		free = np.flatnonzero(~self.alive)
+		if not len(free):
+			return False
+
+		index = free[0]
+		self.pos[index] = pos
+		self.velocity[index] = velocity
+		self.age[index] = 0
+		self.lifetime[index] = lifetime
+		self.frame[index] = frame
+		self.alive[index] = True
+		return True
+
+	def update(self, dt):
+		alive = self.alive
+		self.pos[alive] += self.velocity[alive] * dt
+		self.age[alive] += dt
+		self.alive &= self.age < self.lifetime
+
+	def clear(self):
+		self.alive[:] = False
+
+	def draw(self, surface, offset, lag = 0):
+		indices = np.flatnonzero(self.alive)
+		if not len(indices):
+			return
+
+		# lag seconds of movement are taken back to draw between two simulation steps
+		frames = self.frames
+		positions = self.pos[indices] - self.velocity[indices] * lag - (offset.x, offset.y)
+		positions = np.rint(positions).astype(int).tolist()
+		surface.blits([(frames[frame], pos) for frame, pos in zip(self.frame[indices].tolist(), positions)], False)
+
+	def __len__(self):
+		return int(np.count_nonzero(self.alive))
+
+class ParticleEngine:
+	def __init__(self, camera):
+		# one pool per depth, drawn by the camera right after that layer's sprites
+		self.camera = camera
+		self.pools = {}
+
+		# white silhouettes are built once per source surface and shared by every pool
+		self.frames = []
+		self.silhouettes = {}
+
+	def silhouette(self, surf):
+		if surf not in self.silhouettes:
+			mask_surf = pygame.mask.from_surface(surf).to_surface()
+			mask_surf.set_colorkey((0,0,0))
+			self.silhouettes[surf] = len(self.frames)
+			self.frames.append(mask_surf)
+		return self.silhouettes[surf]
+
+	def spawn(self, pos, surf, z, duration = 200):
+		if z not in self.pools:
+			self.pools[z] = ParticlePool(PARTICLE_CAPACITY, self.frames)
+			self.camera.add_renderer(z, self.pools[z].draw)
+		self.pools[z].spawn(pos, (0,0), duration / 1000, self.silhouette(surf))
+
+	def update(self, dt):
+		for pool in self.pools.values():
+			pool.update(dt)
+
+	def clear(self):
+		for pool in self.pools.values():
+			pool.clear()
+
+	def __len__(self):
+		return sum(len(pool) for pool in self.pools.values())
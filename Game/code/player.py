@@ -2,6 +2,27 @@ import pygame
 from settings import *
 from support import *
 from timer import Timer
+from profiler import profiler
+
+class ScriptedKeys:
+    # drop-in for pygame.key.get_pressed, driven by a script instead of a keyboard
+    def __init__(self):
+        self.pressed = set()
+
+    def press(self, *keys):
+        self.pressed.update(keys)
+
+    def release(self, *keys):
+        if keys:
+            self.pressed.difference_update(keys)
+        else:
+            self.pressed.clear()
+
+    def __call__(self):
+        return self
+
+    def __getitem__(self, key):
+        return key in self.pressed
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, pos, group, collision_sprites, tree_sprites, interaction, soil_layer, toggle_shop_ui, id=0):
@@ -67,6 +88,9 @@ class Player(pygame.sprite.Sprite):
         self.can_interact = False
         self.current_interaction = None
 
+        # Input, replaced by ScriptedKeys when nobody is at the keyboard
+        self.key_source = pygame.key.get_pressed
+
     def use_tool(self):
         if self.selected_tool == 'hoe':
             self.soil_layer.get_hit(self.target_pos)
@@ -108,7 +132,7 @@ class Player(pygame.sprite.Sprite):
         self.image = self.animations[self.status][int(self.frame_index)]
 
     def input(self):
-        keys = pygame.key.get_pressed()
+        keys = self.key_source()
 
         if not self.timers['tool use'].active and not self.sleep:
             # reset movement vectors
@@ -178,24 +202,23 @@ class Player(pygame.sprite.Sprite):
             timer.update()
 
     def collision(self, direction):
-        for sprite in self.collision_sprites.sprites():
-            if hasattr(sprite, 'hitbox'):
-                if sprite.hitbox.colliderect(self.hitbox):
-                    if direction == 'horizontal':
-                        if self.direction.x > 0:  # moving right
-                            self.hitbox.right = sprite.hitbox.left
-                        if self.direction.x < 0:  # moving left
-                            self.hitbox.left = sprite.hitbox.right
-                        self.rect.centerx = self.hitbox.centerx
-                        self.pos.x = self.hitbox.centerx
-
-                    if direction == 'vertical':
-                        if self.direction.y > 0:  # moving down
-                            self.hitbox.bottom = sprite.hitbox.top
-                        if self.direction.y < 0:  # moving up
-                            self.hitbox.top = sprite.hitbox.bottom
-                        self.rect.centery = self.hitbox.centery
-                        self.pos.y = self.hitbox.centery
+        for sprite in self.collision_sprites.nearby(self.hitbox):
+            if sprite.hitbox.colliderect(self.hitbox):
+                if direction == 'horizontal':
+                    if self.direction.x > 0:  # moving right
+                        self.hitbox.right = sprite.hitbox.left
+                    if self.direction.x < 0:  # moving left
+                        self.hitbox.left = sprite.hitbox.right
+                    self.rect.centerx = self.hitbox.centerx
+                    self.pos.x = self.hitbox.centerx
+
+                if direction == 'vertical':
+                    if self.direction.y > 0:  # moving down
+                        self.hitbox.bottom = sprite.hitbox.top
+                    if self.direction.y < 0:  # moving up
+                        self.hitbox.top = sprite.hitbox.bottom
+                    self.rect.centery = self.hitbox.centery
+                    self.pos.y = self.hitbox.centery
 
     def move(self, dt):
         # normalizing a vector 
@@ -206,13 +229,15 @@ class Player(pygame.sprite.Sprite):
         self.pos.x += self.direction.x * self.speed * dt
         self.hitbox.centerx = round(self.pos.x)
         self.rect.centerx = self.hitbox.centerx
-        self.collision('horizontal')
+        with profiler.section('collision'):
+            self.collision('horizontal')
 
         # vertical movement
         self.pos.y += self.direction.y * self.speed * dt
         self.hitbox.centery = round(self.pos.y)
         self.rect.centery = self.hitbox.centery
-        self.collision('vertical')
+        with profiler.section('collision'):
+            self.collision('vertical')
 
     def check_interaction(self):
         self.can_interact = False
@@ -0,0 +1,140 @@
+import json
+import time
+import pygame
+from collections import deque
+from settings import *
+from llm_agent import scheduler
+
+def percentiles(samples):
+	samples = sorted(samples)
+	if not samples:
+		return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+	pick = lambda fraction: samples[min(int(fraction * len(samples)), len(samples) - 1)]
+	return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+class Section:
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+		self.start = None
+
+	def __enter__(self):
+		if self.profiler.enabled:
+			self.start = time.perf_counter()
+
+	def __exit__(self, *exc_info):
+		# a section entered before the profiler was switched on is not counted
+		if self.start is not None:
+			frame = self.profiler.frame
+			frame[self.name] = frame.get(self.name, 0) + (time.perf_counter() - self.start) * 1000
+			self.start = None
+
+class Profiler:
+	def __init__(self, window = PROFILE_WINDOW, export_path = PROFILE_EXPORT):
+		self.enabled = PROFILE or export_path is not None
+		self.visible = False
+
+		# milliseconds spent per section in the current frame, and the last window of frames
+		self.frame = {}
+		self.samples = {}
+		self.window = window
+		self.sections = {}
+
+		self.frame_index = 0
+		self.last_frame = None
+		self.counts = {}
+
+		self.export_path = export_path
+		self.export_file = None
+
+		# overlay text is only re-rendered a few times per second
+		self.font = None
+		self.lines = []
+		self.refresh_time = 0
+
+	def section(self, name):
+		if name not in self.sections:
+			self.sections[name] = Section(self, name)
+		return self.sections[name]
+
+	def toggle(self):
+		self.visible = not self.visible
+		self.enabled = self.visible or PROFILE or self.export_path is not None
+
+	def add_sample(self, name, value):
+		if name not in self.samples:
+			self.samples[name] = deque(maxlen = self.window)
+		self.samples[name].append(value)
+
+	def end_frame(self, level):
+		now = time.perf_counter()
+		if not self.enabled:
+			self.last_frame = None
+			return
+
+		if self.last_frame is not None:
+			self.add_sample('frame', (now - self.last_frame) * 1000)
+		self.last_frame = now
+		for name, value in self.frame.items():
+			self.add_sample(name, value)
+
+		self.counts = level.sprite_counts()
+		if self.export_path:
+			self.export()
+
+		self.frame = {}
+		self.frame_index += 1
+
+	def export(self):
+		if self.export_file is None:
+			self.export_file = open(self.export_path, 'a', buffering = 1)
+
+		frame_samples = self.samples.get('frame')
+		record = {
+			'frame': self.frame_index,
+			'ms': round(frame_samples[-1], 3) if frame_samples else None,
+			'sections': {name: round(value, 3) for name, value in self.frame.items()},
+			'llm': {'queued': scheduler.queue_depth(), 'running': scheduler.running},
+			**self.counts}
+		self.export_file.write(json.dumps(record, separators = (',',':')) + '\n')
+
+	def summary(self):
+		return {name: percentiles(samples) for name, samples in self.samples.items()}
+
+	def render_lines(self):
+		lines = []
+		for name, stats in sorted(self.summary().items()):
+			lines.append(f'{name:<16} p50 {stats["p50"]:6.2f}  p95 {stats["p95"]:6.2f}  p99 {stats["p99"]:6.2f} ms')
+
+		for kind in ('groups', 'layers'):
+			counts = '  '.join(f'{name} {count}' for name, count in self.counts.get(kind, {}).items())
+			lines.append(f'{kind}: {counts}')
+
+		llm = scheduler.stats()
+		lines.append(f'llm queued {llm["queued"]} running {llm["running"]}  '
+			f'chat p95 {llm["interactive"]["p95"]:.2f}s  decide p95 {llm["background"]["p95"]:.2f}s')
+		return [self.font.render(line, True, 'White') for line in lines]
+
+	def display(self, surface):
+		if not self.visible:
+			return
+
+		if self.font is None:
+			self.font = pygame.font.Font(None, 20)
+		if time.perf_counter() - self.refresh_time > 0.25:
+			self.lines = self.render_lines()
+			self.refresh_time = time.perf_counter()
+
+		height = sum(line.get_height() for line in self.lines)
+		width = max((line.get_width() for line in self.lines), default = 0)
+		background = pygame.Surface((width + 16, height + 16), pygame.SRCALPHA)
+		background.fill((0,0,0,160))
+		surface.blit(background, (0,0))
+
+		y = 8
+		for line in self.lines:
+			surface.blit(line, (8,y))
+			y += line.get_height()
+
+# shared by every module that wants to time a section of the frame
+profiler = Profiler()
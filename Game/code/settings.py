@@ -1,9 +1,31 @@
+import os
 from pygame.math import Vector2
 # screen
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 TILE_SIZE = 64
 
+# the simulation always steps FIXED_DT seconds, rendering runs as fast as RENDER_MODE
+# allows: 'capped' at RENDER_FPS, 'uncapped' or 'vsync'
+FIXED_DT = 1 / 60
+MAX_FRAME_TIME = 0.25
+RENDER_MODE = os.environ.get('HARVEST_RENDER_MODE', 'capped')
+RENDER_FPS = 60
+
+# sprites this far outside the camera are still drawn and animated
+CULL_MARGIN = TILE_SIZE * 2
+
+# static map layers are baked into surfaces of this size
+CHUNK_SIZE = 512
+
+# rain spawns RAIN_RATE drops and splashes per second across the whole map,
+# but only the share that falls into the camera is ever simulated
+RAIN_RATE = 60
+RAIN_CAPACITY = 64
+
+# harvest and tree hit flashes alive at once, per layer
+PARTICLE_CAPACITY = 256
+
 # overlay positions 
 OVERLAY_POSITIONS = {
 	'tool' : (40, SCREEN_HEIGHT - 15), 
@@ -49,4 +71,58 @@ SALE_PRICES = {
 PURCHASE_PRICES = {
 	'corn': 4,
 	'tomato': 5
-}
\ No newline at end of file
+}
+
+# the game is lost below BANKRUPT_MONEY and won above WIN_MONEY
+BANKRUPT_MONEY = 100
+WIN_MONEY = 11000
+
+# the neighbour's kid chases the player at this speed, the player walks at 200
+ENEMY_SPEED = 100
+
+# llm endpoint, every value can be overridden with a HARVEST_ environment variable
+LLM_BASE_URL = os.environ.get('HARVEST_LLM_BASE_URL', 'http://10.15.88.73:5023/v1')
+LLM_API_KEY = os.environ.get('HARVEST_LLM_API_KEY', 'ollama')
+LLM_MODEL = os.environ.get('HARVEST_LLM_MODEL', 'llama3.2')
+LLM_MAX_RETRIES = int(os.environ.get('HARVEST_LLM_MAX_RETRIES', 2))
+
+# llm requests run in the background and give up after LLM_TIMEOUT seconds,
+# at most LLM_WORKERS of them at a time
+LLM_TIMEOUT = float(os.environ.get('HARVEST_LLM_TIMEOUT', 30))
+LLM_WORKERS = int(os.environ.get('HARVEST_LLM_WORKERS', 2))
+
+# how many recent request latencies the scheduler keeps for its percentiles
+LLM_LATENCY_WINDOW = 200
+
+# chat history is trimmed to this many estimated tokens, older turns are summarised
+LLM_TOKEN_BUDGET = 2048
+LLM_SUMMARY_BUDGET = 256
+
+# chat replies are shown token by token as they stream in
+LLM_STREAM = True
+
+# decisions are cached, and after LLM_BREAKER_FAILURES failures or slow replies the
+# local rule answers until a probe every LLM_BREAKER_PROBE seconds succeeds
+LLM_DECISION_CACHE = 256
+LLM_BREAKER_FAILURES = 3
+LLM_BREAKER_LATENCY = 2.0
+LLM_BREAKER_PROBE = 60
+
+# the farm is saved here every new day and on quit; in between, changes are appended
+# to a journal every JOURNAL_FLUSH seconds and folded into a new save after JOURNAL_COMPACT records
+SAVE_PATH = os.environ.get('HARVEST_SAVE', '../save/farm.sav')
+JOURNAL_FLUSH = 1
+JOURNAL_COMPACT = 4096
+
+# frame profiler, also toggled in game with F3; HARVEST_PROFILE_EXPORT names a
+# JSON lines file that gets one record per frame
+PROFILE = os.environ.get('HARVEST_PROFILE', '0') == '1'
+PROFILE_EXPORT = os.environ.get('HARVEST_PROFILE_EXPORT')
+PROFILE_WINDOW = 300
+
+# sprite lifecycle audit for long running installs: every AUDIT_INTERVAL frames the
+# groups are checked for orphans, and every new day is compared with tracemalloc
+AUDIT = os.environ.get('HARVEST_AUDIT', '0') == '1'
+AUDIT_EXPORT = os.environ.get('HARVEST_AUDIT_EXPORT')
+AUDIT_INTERVAL = 60
+AUDIT_TOP = 10
@@ -1,8 +1,8 @@
 import pygame 
 from settings import *
-from support import import_folder
-from sprites import Generic
-from random import randint, choice
+from support import import_folder, image_size
+from particles import ParticlePool
+from random import randint
 
 class Sky:
 	def __init__(self):
@@ -11,62 +11,56 @@ class Sky:
 		self.start_color = [255,255,255]
 		self.end_color = (38,101,189)
 
-	def display(self, dt):
+	def update(self, dt):
 		for index, value in enumerate(self.end_color):
 			if self.start_color[index] > value:
 				self.start_color[index] -= 2 * dt
 
+	def display(self):
 		self.full_surf.fill(self.start_color)
 		self.display_surface.blit(self.full_surf, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
 
-class Drop(Generic):
-	def __init__(self, surf, pos, moving, groups, z):
-		
-		# general setup
-		super().__init__(pos, surf, groups, z)
-		self.lifetime = randint(400,500)
-		self.start_time = pygame.time.get_ticks()
-
-		# moving 
-		self.moving = moving
-		if self.moving:
-			self.pos = pygame.math.Vector2(self.rect.topleft)
-			self.direction = pygame.math.Vector2(-2,4)
-			self.speed = randint(200,250)
-
-	def update(self,dt):
-		# movement
-		if self.moving:
-			self.pos += self.direction * self.speed * dt
-			self.rect.topleft = (round(self.pos.x), round(self.pos.y))
-
-		# timer
-		if pygame.time.get_ticks() - self.start_time >= self.lifetime:
-			self.kill()
-
 class Rain:
 	def __init__(self, all_sprites):
 		self.all_sprites = all_sprites
 		self.rain_drops = import_folder('../graphics/rain/drops/')
 		self.rain_floor = import_folder('../graphics/rain/floor/')
-		self.floor_w, self.floor_h =  pygame.image.load('../graphics/world/ground.png').get_size()
+		self.floor_w, self.floor_h = image_size('../graphics/world/ground.png')
+
+		# pooled particles, drawn by the camera at their own depth
+		self.floor = ParticlePool(RAIN_CAPACITY, self.rain_floor)
+		self.drops = ParticlePool(RAIN_CAPACITY, self.rain_drops)
+		self.all_sprites.add_renderer(LAYERS['rain floor'], self.floor.draw)
+		self.all_sprites.add_renderer(LAYERS['rain drops'], self.drops.draw)
+		self.spawn_budget = 0
+
+	def spawn_pos(self, view):
+		return (randint(view.left,view.right),randint(view.top,view.bottom))
+
+	def create_floor(self, view):
+		self.floor.spawn(
+			pos = self.spawn_pos(view), 
+			velocity = (0,0), 
+			lifetime = randint(400,500) / 1000, 
+			frame = randint(0,len(self.rain_floor) - 1))
 
-	def create_floor(self):
-		Drop(
-			surf = choice(self.rain_floor), 
-			pos = (randint(0,self.floor_w),randint(0,self.floor_h)), 
-			moving = False, 
-			groups = self.all_sprites, 
-			z = LAYERS['rain floor'])
+	def create_drops(self, view):
+		speed = randint(200,250)
+		self.drops.spawn(
+			pos = self.spawn_pos(view), 
+			velocity = (-2 * speed,4 * speed), 
+			lifetime = randint(400,500) / 1000, 
+			frame = randint(0,len(self.rain_drops) - 1))
 
-	def create_drops(self):
-		Drop(
-			surf = choice(self.rain_drops), 
-			pos = (randint(0,self.floor_w),randint(0,self.floor_h)), 
-			moving = True, 
-			groups = self.all_sprites, 
-			z = LAYERS['rain drops'])
+	def update(self, dt, raining = True):
+		if raining:
+			# same density as spawning over the whole map, independent of the frame rate
+			view = self.all_sprites.view_rect().clip(pygame.Rect(0, 0, self.floor_w, self.floor_h))
+			self.spawn_budget += RAIN_RATE * dt * view.width * view.height / (self.floor_w * self.floor_h)
+			while self.spawn_budget >= 1:
+				self.spawn_budget -= 1
+				self.create_floor(view)
+				self.create_drops(view)
 
-	def update(self):
-		self.create_floor()
-		self.create_drops()
\ No newline at end of file
+		self.floor.update(dt)
+		self.drops.update(dt)
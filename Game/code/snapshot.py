@@ -0,0 +1,234 @@
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+import numpy as np
+import pygame
+from settings import *
+from soil import FARMABLE, TILLED, PLANTED
+
+# bump when the record layout changes, older files are then ignored
+SNAPSHOT_VERSION = 2
+MAGIC = b'HMSV'
+
+# magic, version, generation, crc32 of the compressed body; the generation names the journal
+# whose records were written on top of this snapshot
+HEADER = struct.Struct('<4sHII')
+
+# money, player x y, enemy x y, raining, tool index, seed index, sky rgb
+STATE = struct.Struct('<qdddd?BB3f')
+GRID = struct.Struct('<HH')
+COUNT = struct.Struct('<H')
+
+# cell x y, crop index, age
+PLANT = struct.Struct('<HHBd')
+
+# health, alive, apple count, followed by an APPLE offset for every apple
+TREE = struct.Struct('<b?B')
+APPLE = struct.Struct('<hh')
+
+# inventories are stored in the order the shop lists them
+ITEMS = tuple(SALE_PRICES)
+SEEDS = tuple(PURCHASE_PRICES)
+CROPS = tuple(GROW_SPEED)
+INVENTORY = struct.Struct(f'<{len(ITEMS) + len(SEEDS)}I')
+
+def capture(level):
+	# read straight from the grid and the per cell index, never from a sprite group scan
+	player = level.player
+	soil = level.soil_layer
+	parts = [
+		STATE.pack(
+			player.money, player.pos.x, player.pos.y, level.player_enemy.pos.x, level.player_enemy.pos.y,
+			level.raining, player.tool_index, player.seed_index, *level.sky.start_color),
+		INVENTORY.pack(*(player.item_inventory[item] for item in ITEMS), *(player.seed_inventory[seed] for seed in SEEDS)),
+		GRID.pack(*soil.grid.shape),
+		soil.grid.tobytes(),
+		COUNT.pack(len(soil.plant_tiles))]
+
+	for (x, y), plant in soil.plant_tiles.items():
+		parts.append(PLANT.pack(x, y, CROPS.index(plant.plant_type), plant.age))
+
+	trees = level.tree_sprites.sprites()
+	parts.append(COUNT.pack(len(trees)))
+	for tree in trees:
+		apples = tree.apple_sprites.sprites()
+		parts.append(TREE.pack(max(-128, min(tree.health, 127)), tree.alive, len(apples)))
+		for apple in apples:
+			parts.append(APPLE.pack(apple.rect.left - tree.rect.left, apple.rect.top - tree.rect.top))
+
+	return b''.join(parts)
+
+def encode(body, generation):
+	compressed = zlib.compress(body, 6)
+	return HEADER.pack(MAGIC, SNAPSHOT_VERSION, generation, zlib.crc32(compressed)) + compressed
+
+def decode(data):
+	if len(data) < HEADER.size:
+		return None
+	magic, version, generation, crc = HEADER.unpack_from(data)
+	compressed = data[HEADER.size:]
+	if magic != MAGIC or version != SNAPSHOT_VERSION or zlib.crc32(compressed) != crc:
+		return None
+	return zlib.decompress(compressed), generation
+
+def place(sprite, x, y):
+	sprite.pos = pygame.math.Vector2(x, y)
+	sprite.hitbox.center = (round(x), round(y))
+	sprite.rect.center = sprite.hitbox.center
+	for group in sprite.groups():
+		if hasattr(group, 'refresh'):
+			group.refresh(sprite)
+
+def parse(level, body):
+	# everything is read and checked before the level is touched, a save that does not
+	# fit the current map is ignored like a corrupt one
+	try:
+		money, player_x, player_y, enemy_x, enemy_y, raining, tool_index, seed_index, *sky_color = STATE.unpack_from(body)
+		offset = STATE.size
+		inventory = INVENTORY.unpack_from(body, offset)
+		offset += INVENTORY.size
+
+		rows, cols = GRID.unpack_from(body, offset)
+		offset += GRID.size
+		grid = np.frombuffer(body, dtype = np.uint8, count = rows * cols, offset = offset).reshape(rows, cols)
+		offset += rows * cols
+
+		(count,) = COUNT.unpack_from(body, offset)
+		offset += COUNT.size
+		plants = []
+		for _ in range(count):
+			plants.append(PLANT.unpack_from(body, offset))
+			offset += PLANT.size
+
+		(count,) = COUNT.unpack_from(body, offset)
+		offset += COUNT.size
+		trees = []
+		for _ in range(count):
+			health, alive, apples = TREE.unpack_from(body, offset)
+			offset += TREE.size
+			trees.append((health, alive, [APPLE.unpack_from(body, offset + index * APPLE.size) for index in range(apples)]))
+			offset += apples * APPLE.size
+	except (struct.error, ValueError):
+		return None
+
+	player = level.player
+	current = level.soil_layer.grid
+	if offset != len(body) or tool_index >= len(player.tools) or seed_index >= len(player.seeds):
+		return None
+	if grid.shape != current.shape or not np.array_equal(grid & FARMABLE, current & FARMABLE):
+		return None
+	if len(trees) != len(level.tree_sprites):
+		return None
+	for x, y, crop, age in plants:
+		if x >= cols or y >= rows or crop >= len(CROPS) or grid[y,x] & (TILLED | PLANTED) != TILLED | PLANTED:
+			return None
+
+	return {
+		'money': money,
+		'player': (player_x, player_y),
+		'enemy': (enemy_x, enemy_y),
+		'raining': raining,
+		'tool_index': tool_index,
+		'seed_index': seed_index,
+		'sky_color': list(sky_color),
+		'inventory': inventory,
+		'grid': grid,
+		'plants': [(x, y, CROPS[crop], age) for x, y, crop, age in plants],
+		'trees': trees}
+
+def restore(level, state):
+	player = level.player
+
+	# player and enemy
+	player.money = state['money']
+	player.tool_index, player.seed_index = state['tool_index'], state['seed_index']
+	player.selected_tool = player.tools[player.tool_index]
+	player.selected_seed = player.seeds[player.seed_index]
+	inventory = state['inventory']
+	player.item_inventory.update(zip(ITEMS, inventory[:len(ITEMS)]))
+	player.seed_inventory.update(zip(SEEDS, inventory[len(ITEMS):]))
+	place(player, *state['player'])
+	place(level.player_enemy, *state['enemy'])
+
+	# weather
+	level.raining = state['raining']
+	level.soil_layer.raining = state['raining']
+	level.sky.start_color = state['sky_color']
+
+	# soil
+	level.soil_layer.restore(state['grid'], state['plants'])
+
+	# trees, in the order the map created them
+	for tree, (health, alive, apples) in zip(level.tree_sprites.sprites(), state['trees']):
+		tree.health = health
+		if not alive and tree.alive:
+			tree.become_stump()
+
+		for apple in tree.apple_sprites.sprites():
+			apple.kill()
+		for x, y in apples:
+			tree.create_apple((tree.rect.left + x, tree.rect.top + y))
+
+# the autosave thread and a quit can both write the same file
+write_lock = threading.Lock()
+
+def write_snapshot(path, body, generation):
+	data = encode(body, generation)
+	temp_path = path + '.tmp'
+	with write_lock:
+		os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+		with open(temp_path, 'wb') as file:
+			file.write(data)
+			file.flush()
+			os.fsync(file.fileno())
+		os.replace(temp_path, path)
+
+def read_snapshot(path):
+	try:
+		with open(path, 'rb') as file:
+			return decode(file.read())
+	except (OSError, zlib.error):
+		return None
+
+class Autosaver:
+	def __init__(self):
+		# writes run in the order they were asked for, so a journal never gets ahead of its snapshot
+		self.tasks = deque()
+		self.condition = threading.Condition()
+		self.busy = False
+		threading.Thread(target = self.work, name = 'autosave', daemon = True).start()
+
+	def submit(self, task, *args):
+		with self.condition:
+			self.tasks.append((task, args))
+			self.condition.notify()
+
+	def request(self, path, body, generation):
+		self.submit(write_snapshot, path, body, generation)
+
+	def work(self):
+		while True:
+			with self.condition:
+				while not self.tasks:
+					self.condition.wait()
+				task, args = self.tasks.popleft()
+				self.busy = True
+			# a failed write is reported and skipped, the thread has to outlive it or every wait() hangs
+			try:
+				task(*args)
+			except Exception as error:
+				print(f'autosave failed: {error!r}')
+			finally:
+				with self.condition:
+					self.busy = False
+					self.condition.notify_all()
+
+	def wait(self):
+		with self.condition:
+			while self.tasks or self.busy:
+				self.condition.wait()
+
+# one writer thread for the whole process
+autosaver = Autosaver()
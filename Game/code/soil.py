@@ -1,9 +1,24 @@
 import pygame
+import numpy as np
 from settings import *
-from pytmx.util_pygame import load_pygame
+from map_loader import load_map
 from support import *
 from random import choice
 
+# soil grid cell flags
+FARMABLE = 1
+TILLED = 2
+WATERED = 4
+PLANTED = 8
+HARVESTABLE = 16
+
+# soil graphic for every 4 bit neighbour mask, see SoilLayer.update_soil_tile
+SOIL_TILE_TYPES = (
+	'o', 'b', 'l', 'bl',
+	't', 'tb', 'tl', 'tbr',
+	'r', 'br', 'lr', 'lrb',
+	'tr', 'tbl', 'lrt', 'x')
+
 class SoilTile(pygame.sprite.Sprite):
 	def __init__(self, pos, surf, groups):
 		super().__init__(groups)
@@ -42,21 +57,24 @@ class Plant(pygame.sprite.Sprite):
 
 	def grow(self):
 		if self.check_watered(self.rect.center):
-			self.age += self.grow_speed
+			self.set_age(self.age + self.grow_speed)
 
-			if int(self.age) > 0:
-				self.z = LAYERS['main']
-				self.hitbox = self.rect.copy().inflate(-26,-self.rect.height * 0.4)
+	def set_age(self, age):
+		self.age = age
 
-			if self.age >= self.max_age:
-				self.age = self.max_age
-				self.harvestable = True
+		if int(self.age) > 0:
+			self.z = LAYERS['main']
+			self.hitbox = self.rect.copy().inflate(-26,-self.rect.height * 0.4)
 
-			self.image = self.frames[int(self.age)]
-			self.rect = self.image.get_rect(midbottom = self.soil.rect.midbottom + pygame.math.Vector2(0,self.y_offset))
+		if self.age >= self.max_age:
+			self.age = self.max_age
+			self.harvestable = True
+
+		self.image = self.frames[int(self.age)]
+		self.rect = self.image.get_rect(midbottom = self.soil.rect.midbottom + pygame.math.Vector2(0,self.y_offset))
 
 class SoilLayer:
-	def __init__(self, all_sprites, collision_sprites):
+	def __init__(self, all_sprites, collision_sprites, journal):
 
 		# sprite groups
 		self.all_sprites = all_sprites
@@ -65,140 +83,171 @@ class SoilLayer:
 		self.water_sprites = pygame.sprite.Group()
 		self.plant_sprites = pygame.sprite.Group()
 
+		# per cell sprite index, so tools never scan the whole farm
+		self.soil_tiles = {}
+		self.water_tiles = {}
+		self.plant_tiles = {}
+
+		# every change to the farm is written to the save journal
+		self.journal = journal
+
 		# graphics
 		self.soil_surfs = import_folder_dict('../graphics/soil/')
 		self.water_surfs = import_folder('../graphics/soil_water')
+		preload(*(f'../graphics/fruit/{plant_type}' for plant_type in GROW_SPEED))
 
 		self.create_soil_grid()
-		self.create_hit_rects()
 
 
 	def create_soil_grid(self):
-		ground = pygame.image.load('../graphics/world/ground.png')
-		h_tiles, v_tiles = ground.get_width() // TILE_SIZE, ground.get_height() // TILE_SIZE
+		map_data = load_map('../data/map.tmx')
+		h_tiles, v_tiles = map_data.width, map_data.height
 		
-		self.grid = [[[] for col in range(h_tiles)] for row in range(v_tiles)]
-		for x, y, _ in load_pygame('../data/map.tmx').get_layer_by_name('Farmable').tiles():
-			self.grid[y][x].append('F')
-
-	def create_hit_rects(self):
-		self.hit_rects = []
-		for index_row, row in enumerate(self.grid):
-			for index_col, cell in enumerate(row):
-				if 'F' in cell:
-					x = index_col * TILE_SIZE
-					y = index_row * TILE_SIZE
-					rect = pygame.Rect(x,y,TILE_SIZE, TILE_SIZE)
-					self.hit_rects.append(rect)
-
-	def get_hit(self, point):
-		for rect in self.hit_rects:
-			if rect.collidepoint(point):
+		self.grid = np.zeros((v_tiles, h_tiles), dtype = np.uint8)
+		for x, y, _ in map_data.get_layer_by_name('Farmable').tiles():
+			self.grid[y,x] |= FARMABLE
 
-				x = rect.x // TILE_SIZE
-				y = rect.y // TILE_SIZE
+	def get_cell(self, pos):
+		x = int(pos[0]) // TILE_SIZE
+		y = int(pos[1]) // TILE_SIZE
+		height, width = self.grid.shape
+		if 0 <= x < width and 0 <= y < height:
+			return x, y
 
-				if 'F' in self.grid[y][x]:
-					self.grid[y][x].append('X')
-					self.create_soil_tiles()
-					if self.raining:
-						self.water_all()
+	def get_hit(self, point):
+		cell = self.get_cell(point)
+		if cell:
+			x, y = cell
+			if self.grid[y,x] & FARMABLE:
+				self.till(x, y, self.raining)
+
+	def till(self, x, y, raining):
+		self.grid[y,x] |= TILLED
+		self.update_soil_tiles(x, y)
+		if raining:
+			self.water_all()
+		self.journal.till(x, y, raining)
 
 	def water(self, target_pos):
-		for soil_sprite in self.soil_sprites.sprites():
-			if soil_sprite.rect.collidepoint(target_pos):
-
-				x = soil_sprite.rect.x // TILE_SIZE
-				y = soil_sprite.rect.y // TILE_SIZE
-				self.grid[y][x].append('W')
-
-				pos = soil_sprite.rect.topleft
-				surf = choice(self.water_surfs)
-				WaterTile(pos, surf, [self.all_sprites, self.water_sprites])
+		cell = self.get_cell(target_pos)
+		if cell in self.soil_tiles and cell not in self.water_tiles:
+			x, y = cell
+			self.grid[y,x] |= WATERED
+			self.create_water_tile(x, y)
+			self.journal.water(x, y)
+
+	def create_water_tile(self, x, y):
+		pos = (x * TILE_SIZE,y * TILE_SIZE)
+		surf = choice(self.water_surfs)
+		self.water_tiles[(x,y)] = WaterTile(pos, surf, [self.all_sprites, self.water_sprites])
 
 	def water_all(self):
-		for index_row, row in enumerate(self.grid):
-			for index_col, cell in enumerate(row):
-				if 'X' in cell and 'W' not in cell:
-					cell.append('W')
-					x = index_col * TILE_SIZE
-					y = index_row * TILE_SIZE
-					WaterTile((x,y), choice(self.water_surfs), [self.all_sprites, self.water_sprites])
+		dry = (self.grid & (TILLED | WATERED)) == TILLED
+		self.grid[dry] |= WATERED
+		for index_row, index_col in np.argwhere(dry):
+			self.create_water_tile(int(index_col), int(index_row))
 
 	def remove_water(self):
 
 		# destroy all water sprites
 		for sprite in self.water_sprites.sprites():
 			sprite.kill()
+		self.water_tiles.clear()
 
 		# clean up the grid
-		for row in self.grid:
-			for cell in row:
-				if 'W' in cell:
-					cell.remove('W')
+		self.grid &= ~np.uint8(WATERED)
 
 	def check_watered(self, pos):
 		x = pos[0] // TILE_SIZE
 		y = pos[1] // TILE_SIZE
-		cell = self.grid[y][x]
-		is_watered = 'W' in cell
+		is_watered = bool(self.grid[y,x] & WATERED)
 		return is_watered
 
-	def plant_seed(self, target_pos, seed):
-		for soil_sprite in self.soil_sprites.sprites():
-			if soil_sprite.rect.collidepoint(target_pos):
+	def count_tilled(self):
+		return int(np.count_nonzero(self.grid & TILLED))
 
-				x = soil_sprite.rect.x // TILE_SIZE
-				y = soil_sprite.rect.y // TILE_SIZE
+	def find_harvestable(self):
+		return [(int(x), int(y)) for y, x in np.argwhere(self.grid & HARVESTABLE)]
 
-				if 'P' not in self.grid[y][x]:
-					self.grid[y][x].append('P')
-					Plant(seed, [self.all_sprites, self.plant_sprites, self.collision_sprites], soil_sprite, self.check_watered)
+	def plant_seed(self, target_pos, seed):
+		cell = self.get_cell(target_pos)
+		if cell in self.soil_tiles:
+			x, y = cell
+			if not self.grid[y,x] & PLANTED:
+				self.grid[y,x] |= PLANTED
+				self.plant_tiles[cell] = Plant(seed, [self.all_sprites, self.plant_sprites, self.collision_sprites], self.soil_tiles[cell], self.check_watered)
+				self.journal.plant(x, y, seed)
+
+	def remove_plant(self, pos):
+		x, y = self.get_cell(pos)
+		self.grid[y,x] &= ~np.uint8(PLANTED | HARVESTABLE)
+		self.plant_tiles.pop((x,y), None)
+
+	def harvestable_plants(self, rect):
+		# plants reach at most a tile above their soil, so look one cell around the rect
+		height, width = self.grid.shape
+		left = max(rect.left // TILE_SIZE - 1, 0)
+		top = max(rect.top // TILE_SIZE - 1, 0)
+		right = min(rect.right // TILE_SIZE + 1, width - 1)
+		bottom = min(rect.bottom // TILE_SIZE + 1, height - 1)
+		cells = self.grid[top:bottom + 1, left:right + 1] & HARVESTABLE
+		return [self.plant_tiles[(left + int(x), top + int(y))] for y, x in np.argwhere(cells)]
 
 	def update_plants(self):
 		for plant in self.plant_sprites.sprites():
 			plant.grow()
+			if plant.harvestable:
+				self.grid[plant.soil.rect.y // TILE_SIZE, plant.soil.rect.x // TILE_SIZE] |= HARVESTABLE
+
+			# growing changes the plant's layer, rect and hitbox
+			for group in plant.groups():
+				if hasattr(group, 'refresh'):
+					group.refresh(plant)
+
+	def is_tilled(self, x, y):
+		height, width = self.grid.shape
+		return 0 <= y < height and 0 <= x < width and bool(self.grid[y,x] & TILLED)
+
+	def update_soil_tile(self, x, y):
+		if not self.is_tilled(x, y):
+			return
+
+		# 4 bit neighbour mask: top 1, right 2, bottom 4, left 8
+		mask = self.is_tilled(x, y - 1) | self.is_tilled(x + 1, y) << 1 | self.is_tilled(x, y + 1) << 2 | self.is_tilled(x - 1, y) << 3
+		surf = self.soil_surfs[SOIL_TILE_TYPES[mask]]
+
+		# swap the graphic in place so plants keep their soil sprite
+		if (x,y) in self.soil_tiles:
+			self.soil_tiles[(x,y)].image = surf
+		else:
+			self.soil_tiles[(x,y)] = SoilTile(
+				pos = (x * TILE_SIZE,y * TILE_SIZE), 
+				surf = surf, 
+				groups = [self.all_sprites, self.soil_sprites])
+
+	def update_soil_tiles(self, x, y):
+		# tilling a cell only changes its own tile and its four neighbours
+		for dx, dy in ((0,0), (0,-1), (1,0), (0,1), (-1,0)):
+			self.update_soil_tile(x + dx, y + dy)
+
+	def restore(self, grid, plants):
+		# rebuild every soil sprite from a saved grid and (x, y, plant_type, age) records
+		for sprite in self.soil_sprites.sprites() + self.water_sprites.sprites() + self.plant_sprites.sprites():
+			sprite.kill()
+		self.soil_tiles.clear()
+		self.water_tiles.clear()
+		self.plant_tiles.clear()
+
+		self.grid[:] = grid
+		self.create_soil_tiles()
+		for index_row, index_col in np.argwhere(self.grid & WATERED):
+			self.create_water_tile(int(index_col), int(index_row))
+
+		for x, y, plant_type, age in plants:
+			plant = Plant(plant_type, [self.all_sprites, self.plant_sprites, self.collision_sprites], self.soil_tiles[(x,y)], self.check_watered)
+			plant.set_age(age)
+			self.plant_tiles[(x,y)] = plant
 
 	def create_soil_tiles(self):
-		self.soil_sprites.empty()
-		for index_row, row in enumerate(self.grid):
-			for index_col, cell in enumerate(row):
-				if 'X' in cell:
-					
-					# tile options 
-					t = 'X' in self.grid[index_row - 1][index_col]
-					b = 'X' in self.grid[index_row + 1][index_col]
-					r = 'X' in row[index_col + 1]
-					l = 'X' in row[index_col - 1]
-
-					tile_type = 'o'
-
-					# all sides
-					if all((t,r,b,l)): tile_type = 'x'
-
-					# horizontal tiles only
-					if l and not any((t,r,b)): tile_type = 'r'
-					if r and not any((t,l,b)): tile_type = 'l'
-					if r and l and not any((t,b)): tile_type = 'lr'
-
-					# vertical only 
-					if t and not any((r,l,b)): tile_type = 'b'
-					if b and not any((r,l,t)): tile_type = 't'
-					if b and t and not any((r,l)): tile_type = 'tb'
-
-					# corners 
-					if l and b and not any((t,r)): tile_type = 'tr'
-					if r and b and not any((t,l)): tile_type = 'tl'
-					if l and t and not any((b,r)): tile_type = 'br'
-					if r and t and not any((b,l)): tile_type = 'bl'
-
-					# T shapes
-					if all((t,b,r)) and not l: tile_type = 'tbr'
-					if all((t,b,l)) and not r: tile_type = 'tbl'
-					if all((l,r,t)) and not b: tile_type = 'lrb'
-					if all((l,r,b)) and not t: tile_type = 'lrt'
-
-					SoilTile(
-						pos = (index_col * TILE_SIZE,index_row * TILE_SIZE), 
-						surf = self.soil_surfs[tile_type], 
-						groups = [self.all_sprites, self.soil_sprites])
\ No newline at end of file
+		for index_row, index_col in np.argwhere(self.grid & TILLED):
+			self.update_soil_tile(int(index_col), int(index_row))
\ No newline at end of file
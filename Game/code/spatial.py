@@ -0,0 +1,113 @@
+import pygame
+from settings import *
+
+class SpatialHash:
+	def __init__(self, cell_size = TILE_SIZE):
+		self.cell_size = cell_size
+		self.cells = {}
+		self.sprite_cells = {}
+
+	def cell_range(self, rect):
+		size = self.cell_size
+		left = rect.left // size
+		top = rect.top // size
+		right = max(rect.right - 1, rect.left) // size
+		bottom = max(rect.bottom - 1, rect.top) // size
+		return left, top, right, bottom
+
+	def insert(self, sprite, rect):
+		bounds = self.cell_range(rect)
+		self.sprite_cells[sprite] = bounds
+		left, top, right, bottom = bounds
+		for x in range(left, right + 1):
+			for y in range(top, bottom + 1):
+				self.cells.setdefault((x,y), set()).add(sprite)
+
+	def remove(self, sprite):
+		bounds = self.sprite_cells.pop(sprite, None)
+		if bounds is None:
+			return
+		left, top, right, bottom = bounds
+		for x in range(left, right + 1):
+			for y in range(top, bottom + 1):
+				cell = self.cells[(x,y)]
+				cell.discard(sprite)
+				if not cell:
+					del self.cells[(x,y)]
+
+	def move(self, sprite, rect):
+		# only touch the cells when the sprite actually crossed a cell border
+		if self.sprite_cells.get(sprite) != self.cell_range(rect):
+			self.remove(sprite)
+			self.insert(sprite, rect)
+
+	def query(self, rect):
+		found = set()
+		left, top, right, bottom = self.cell_range(rect)
+		for x in range(left, right + 1):
+			for y in range(top, bottom + 1):
+				cell = self.cells.get((x,y))
+				if cell:
+					found.update(cell)
+		return found
+
+	def __contains__(self, sprite):
+		return sprite in self.sprite_cells
+
+	def __len__(self):
+		return len(self.sprite_cells)
+
+class CollisionGroup(pygame.sprite.Group):
+	def __init__(self):
+		super().__init__()
+
+		# immovable hitboxes never leave their cells, plants are re-filed as they grow
+		self.static_grid = SpatialHash(TILE_SIZE)
+		self.dynamic_grid = SpatialHash(TILE_SIZE)
+		self.dynamic_sprites = set()
+		self.order = {}
+		self.counter = 0
+
+		# hitboxes are set after the sprite joins its groups, so they are filed on the next query
+		self.pending = []
+
+	def add_internal(self, sprite, layer = None):
+		super().add_internal(sprite, layer)
+		self.pending.append(sprite)
+
+	def remove_internal(self, sprite):
+		super().remove_internal(sprite)
+		if self.order.pop(sprite, None) is not None:
+			self.static_grid.remove(sprite)
+			self.dynamic_grid.remove(sprite)
+			self.dynamic_sprites.discard(sprite)
+		elif sprite in self.pending:
+			self.pending.remove(sprite)
+
+	def file_pending(self):
+		for sprite in self.pending:
+			self.order[sprite] = self.counter
+			self.counter += 1
+
+			# anything without a hitbox yet (a fresh seed) only collides once it has grown one
+			if hasattr(sprite, 'hitbox'):
+				self.static_grid.insert(sprite, sprite.hitbox)
+			else:
+				self.dynamic_sprites.add(sprite)
+		self.pending.clear()
+
+	def refresh(self, sprite):
+		# re-file a sprite after its hitbox changed
+		self.file_pending()
+		if sprite in self.static_grid:
+			self.static_grid.move(sprite, sprite.hitbox)
+		elif sprite in self.dynamic_sprites and hasattr(sprite, 'hitbox'):
+			self.dynamic_grid.move(sprite, sprite.hitbox)
+
+	def nearby(self, rect):
+		self.file_pending()
+		sprites = list(self.static_grid.query(rect) | self.dynamic_grid.query(rect))
+
+		# resolve in the order the sprites were added, like a plain group walk would
+		sprites.sort(key = self.order.get)
+		return sprites
@@ -2,6 +2,7 @@ import pygame
 from settings import *
 from random import randint, choice
 from timer import Timer
+from support import load_image
 
 class Generic(pygame.sprite.Sprite):
 	def __init__(self, pos, surf, groups, z = LAYERS['main']):
@@ -18,6 +19,9 @@ class Interaction(Generic):
 		self.name = name
 
 class Water(Generic):
+	# only animated while near the camera
+	cosmetic = True
+
 	def __init__(self, pos, frames, groups):
 
 		#animation setup
@@ -45,68 +49,69 @@ class WildFlower(Generic):
 		super().__init__(pos, surf, groups)
 		self.hitbox = self.rect.copy().inflate(-20,-self.rect.height * 0.9)
 
-class Particle(Generic):
-	def __init__(self, pos, surf, groups, z, duration = 200):
-		super().__init__(pos, surf, groups, z)
-		self.start_time = pygame.time.get_ticks()
-		self.duration = duration
-
-		# white surface 
-		mask_surf = pygame.mask.from_surface(self.image)
-		new_surf = mask_surf.to_surface()
-		new_surf.set_colorkey((0,0,0))
-		self.image = new_surf
-
-	def update(self,dt):
-		current_time = pygame.time.get_ticks()
-		if current_time - self.start_time > self.duration:
-			self.kill()
-
 class Tree(Generic):
-	def __init__(self, pos, surf, groups, name, player_add):
+	def __init__(self, pos, surf, groups, name, player_add, index, journal):
 		super().__init__(pos, surf, groups)
 
+		# Sprite.groups() is unordered, so keep the camera group around for apples and particles
+		self.all_sprites = groups[0]
+
 		# tree attributes
 		self.health = 5
 		self.alive = True
 		stump_path = f'../graphics/stumps/{"small" if name == "Small" else "large"}.png'
-		self.stump_surf = pygame.image.load(stump_path).convert_alpha()
+		self.stump_surf = load_image(stump_path)
 
 		# apples
-		self.apple_surf = pygame.image.load('../graphics/fruit/apple.png')
+		self.apple_surf = load_image('../graphics/fruit/apple.png')
 		self.apple_pos = APPLE_POS[name]
 		self.apple_sprites = pygame.sprite.Group()
 		self.create_fruit()
 
 		self.player_add = player_add
 
+		# trees are journaled by the order the map lists them
+		self.index = index
+		self.journal = journal
+
 
 	def damage(self):
 		
-		# damaging the tree
-		self.health -= 1
+		# damaging the tree, stumps stay at 0 but can still drop the apples they kept
+		self.health = max(self.health - 1, 0)
 
 
 		# remove an apple
+		apple_offset = None
 		if len(self.apple_sprites.sprites()) > 0:
 			random_apple = choice(self.apple_sprites.sprites())
-			Particle(
+			self.all_sprites.particles.spawn(
 				pos = random_apple.rect.topleft,
 				surf = random_apple.image, 
-				groups = self.groups()[0], 
 				z = LAYERS['fruit'])
 			self.player_add('apple')
 			random_apple.kill()
+			apple_offset = (random_apple.rect.left - self.rect.left, random_apple.rect.top - self.rect.top)
+
+		self.journal.damage(self.index, apple_offset)
 
 	def check_death(self):
 		if self.health <= 0:
-			Particle(self.rect.topleft, self.image, self.groups()[0], LAYERS['fruit'], 300)
-			self.image = self.stump_surf
-			self.rect = self.image.get_rect(midbottom = self.rect.midbottom)
-			self.hitbox = self.rect.copy().inflate(-10,-self.rect.height * 0.6)
-			self.alive = False
+			self.all_sprites.particles.spawn(self.rect.topleft, self.image, LAYERS['fruit'], 300)
+			self.become_stump()
 			self.player_add('wood')
 
+	def become_stump(self):
+		self.image = self.stump_surf
+		self.rect = self.image.get_rect(midbottom = self.rect.midbottom)
+		self.hitbox = self.rect.copy().inflate(-10,-self.rect.height * 0.6)
+		self.alive = False
+
+		# keep the camera and collision indexes in sync with the stump
+		for group in self.groups():
+			if hasattr(group, 'refresh'):
+				group.refresh(self)
+
 	def update(self,dt):
 		if self.alive:
 			self.check_death()
@@ -116,8 +121,11 @@ class Tree(Generic):
 			if randint(0,10) < 2:
 				x = pos[0] + self.rect.left
 				y = pos[1] + self.rect.top
-				Generic(
-					pos = (x,y), 
-					surf = self.apple_surf, 
-					groups = [self.apple_sprites,self.groups()[0]],
-					z = LAYERS['fruit'])
\ No newline at end of file
+				self.create_apple((x,y))
+
+	def create_apple(self, pos):
+		Generic(
+			pos = pos, 
+			surf = self.apple_surf, 
+			groups = [self.apple_sprites,self.all_sprites],
+			z = LAYERS['fruit'])
\ No newline at end of file
@@ -1,24 +1,149 @@
-from os import walk
+from os import walk, path as os_path
+from collections import OrderedDict
 import pygame
 
+# process wide asset cache, shared by every sprite and every level
+asset_cache = OrderedDict()
+asset_sizes = {}
+cache_limit = None
+cache_bytes = 0
+
+def surface_bytes(asset):
+	if isinstance(asset, pygame.Surface):
+		return asset.get_bytesize() * asset.get_width() * asset.get_height()
+	if isinstance(asset, dict):
+		asset = asset.values()
+	return sum(surface_bytes(surf) for surf in asset)
+
+def set_cache_limit(limit):
+	# limit in bytes, None keeps every asset for the lifetime of the process
+	global cache_limit
+	cache_limit = limit
+	evict()
+
+def clear_cache():
+	global cache_bytes
+	asset_cache.clear()
+	cache_bytes = 0
+
+def evict(keep = None):
+	global cache_bytes
+	if cache_limit is None:
+		return
+
+	# drop the least recently used assets, sprites still holding them keep them alive
+	for key in list(asset_cache):
+		if cache_bytes <= cache_limit:
+			break
+		if key != keep:
+			cache_bytes -= surface_bytes(asset_cache.pop(key))
+
+def cached(key, load):
+	global cache_bytes
+	if key in asset_cache:
+		asset_cache.move_to_end(key)
+		return asset_cache[key]
+
+	asset = load()
+	asset_cache[key] = asset
+	cache_bytes += surface_bytes(asset)
+	evict(keep = key)
+	return asset
+
+def convert(surf):
+	# without a window (headless runs) surfaces stay in their loaded pixel format
+	return surf.convert_alpha() if pygame.display.get_surface() else surf
+
+class NullSound:
+	# stands in for pygame.mixer Sound and Channel objects when there is no audio
+	def play(self, *args, **kwargs):
+		pass
+
+	def stop(self):
+		pass
+
+	def set_volume(self, *volume):
+		pass
+
+	def get_busy(self):
+		return False
+
+def load_image(path, alpha = True):
+	path = os_path.normpath(path)
+
+	def load():
+		surf = pygame.image.load(path)
+		asset_sizes[path] = surf.get_size()
+		return convert(surf) if alpha else surf
+
+	return cached(('image', path, alpha), load)
+
+def image_size(path):
+	# only the size is kept, so asking for it never pins a large image in memory
+	path = os_path.normpath(path)
+	if path not in asset_sizes:
+		asset_sizes[path] = pygame.image.load(path).get_size()
+	return asset_sizes[path]
+
 def import_folder(path):
-	surface_list = []
+	path = os_path.normpath(path)
+
+	def load():
+		surface_list = []
+
+		for _, __, img_files in walk(path):
+			for image in img_files:
+				full_path = path + '/' + image
+				image_surf = convert(pygame.image.load(full_path))
+				surface_list.append(image_surf)
 
-	for _, __, img_files in walk(path):
-		for image in img_files:
-			full_path = path + '/' + image
-			image_surf = pygame.image.load(full_path).convert_alpha()
-			surface_list.append(image_surf)
+		return surface_list
 
-	return surface_list
+	return cached(('folder', path), load)
 
 def import_folder_dict(path):
-	surface_dict = {}
+	path = os_path.normpath(path)
+
+	def load():
+		surface_dict = {}
+
+		for _, __, img_files in walk(path):
+			for image in img_files:
+				full_path = path + '/' + image
+				image_surf = convert(pygame.image.load(full_path))
+				surface_dict[image.split('.')[0]] = image_surf
+
+		return surface_dict
+
+	return cached(('folder dict', path), load)
+
+def preload(*paths):
+	# warm the cache up front so the first use of an asset does not hitch a frame
+	for asset_path in paths:
+		if os_path.isdir(asset_path):
+			import_folder(asset_path)
+		else:
+			load_image(asset_path)
+
+def bake_chunks(tiles, chunk_width, chunk_height):
+	# composite (pos, surf) tiles into as few chunk surfaces as the area needs
+	chunks = {}
+	for (x, y), surf in tiles:
+		rect = surf.get_rect(topleft = (x,y))
+		for chunk_x in range(rect.left // chunk_width, (rect.right - 1) // chunk_width + 1):
+			for chunk_y in range(rect.top // chunk_height, (rect.bottom - 1) // chunk_height + 1):
+				if (chunk_x, chunk_y) not in chunks:
+					chunks[(chunk_x, chunk_y)] = pygame.Surface((chunk_width, chunk_height), pygame.SRCALPHA)
+				chunks[(chunk_x, chunk_y)].blit(surf, (x - chunk_x * chunk_width, y - chunk_y * chunk_height))
 
-	for _, __, img_files in walk(path):
-		for image in img_files:
-			full_path = path + '/' + image
-			image_surf = pygame.image.load(full_path).convert_alpha()
-			surface_dict[image.split('.')[0]] = image_surf
+	return [((chunk_x * chunk_width, chunk_y * chunk_height), surf) for (chunk_x, chunk_y), surf in chunks.items()]
 
-	return surface_dict
\ No newline at end of file
+def split_chunks(surf, chunk_width, chunk_height):
+	# subsurfaces share pixels with the source, so a cached image is not copied
+	chunks = []
+	bounds = surf.get_rect()
+	for x in range(0, bounds.width, chunk_width):
+		for y in range(0, bounds.height, chunk_height):
+			rect = pygame.Rect(x, y, chunk_width, chunk_height).clip(bounds)
+			chunks.append(((x,y), surf.subsurface(rect)))
+	return chunks
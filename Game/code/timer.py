@@ -1,5 +1,25 @@
 import pygame 
 
+# headless runs advance this clock themselves instead of reading the wall clock
+simulated_ticks = None
+
+def use_simulated_clock(start = 0):
+	global simulated_ticks
+	simulated_ticks = start
+
+def use_wall_clock():
+	global simulated_ticks
+	simulated_ticks = None
+
+def advance_clock(dt):
+	global simulated_ticks
+	simulated_ticks += dt * 1000
+
+def get_ticks():
+	if simulated_ticks is None:
+		return pygame.time.get_ticks()
+	return int(simulated_ticks)
+
 class Timer:
 	def __init__(self,duration,func = None):
 		self.duration = duration
@@ -9,14 +29,14 @@ class Timer:
 
 	def activate(self):
 		self.active = True
-		self.start_time = pygame.time.get_ticks()
+		self.start_time = get_ticks()
 
 	def deactivate(self):
 		self.active = False
 		self.start_time = 0
 
 	def update(self):
-		current_time = pygame.time.get_ticks()
+		current_time = get_ticks()
 		if current_time - self.start_time >= self.duration:
 			if self.func and self.start_time != 0:
 				self.func()
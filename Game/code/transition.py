@@ -12,10 +12,11 @@ class Transition:
 		# overlay image
 		self.image = pygame.Surface((SCREEN_WIDTH,SCREEN_HEIGHT))
 		self.color = 255
-		self.speed = -0.5
+		self.speed = -30
 
-	def play(self):
-		self.color += self.speed
+	def update(self, dt):
+		# colour units per second
+		self.color += self.speed * dt
 		if self.color <= 0:
 			self.speed *= -1
 			self.color = 0
@@ -23,7 +24,8 @@ class Transition:
 		if self.color > 255:
 			self.color = 255
 			self.player.sleep = False
-			self.speed = -0.5
+			self.speed = -30
 
+	def display(self):
 		self.image.fill((self.color,self.color,self.color))
 		self.display_surface.blit(self.image, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
\ No newline at end of file